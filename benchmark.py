@@ -0,0 +1,378 @@
+# Plik: benchmark.py
+# Lokalny benchmark end-to-end bota - bez CoinGecko, AlphaVantage, alternative.me,
+# Watcher Guru i Gemini. Wszystkie zewnętrzne API zastępują atrapy na 127.0.0.1
+# (konfigurowalne opóźnienia, błędy, odpowiedzi 429/503), a Gemini - atrapa klienta.
+#
+# Przykłady:
+#   python benchmark.py                                   # raport p50/p95/p99 + liczba zapytań
+#   python benchmark.py --save-baseline bench_baseline.json
+#   python benchmark.py --baseline bench_baseline.json    # kod wyjścia 1 przy regresji
+#   python benchmark.py --latency-ms 200 --error-rate 0.05 --throttle-rate 0.05
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+from aiohttp import web
+
+BENCH_COINS = [
+    ('bitcoin', 'btc', 'Bitcoin'), ('ethereum', 'eth', 'Ethereum'), ('solana', 'sol', 'Solana'),
+    ('ripple', 'xrp', 'XRP'), ('cardano', 'ada', 'Cardano'), ('dogecoin', 'doge', 'Dogecoin'),
+    ('tether', 'usdt', 'Tether'), ('chainlink', 'link', 'Chainlink'),
+]
+SCENARIOS = ('market_report', 'slash_analysis', 'watcher_guru_forwarder', 'ai_analysis_embed')
+ANALYSIS_INPUTS = ['bitcoin', 'eth', 'solana', 'bitcoin, ethereum, solana', 'doge']
+NEWS_PER_POLL = 3 # Ile nowych wpisów pojawia się w kanale RSS przy każdym pobraniu
+
+
+# --- Atrapy zewnętrznych API ---
+
+class FakeUpstreams:
+    """Serwer aiohttp udający wszystkie zewnętrzne API; liczy zapytania per trasa."""
+
+    def __init__(self, latency_ms, jitter_ms, error_rate, throttle_rate, seed):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.news_counter = 0
+        self.failing_routes = set() # Trasy, które zawsze odpowiadają 500 (kontrole poprawności)
+        self.base_url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_get('/coingecko/coins/markets', self.coins_markets)
+        app.router.add_get('/coingecko/coins/list', self.coins_list)
+        app.router.add_get('/coingecko/coins/{coin_id}/market_chart', self.market_chart)
+        app.router.add_get('/coingecko/coins/{coin_id}/market_chart/range', self.market_chart)
+        app.router.add_get('/alphavantage/query', self.economic_calendar)
+        app.router.add_get('/fng/', self.fear_greed)
+        app.router.add_get('/rss', self.rss)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def _faults(self, request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.calls[route] += 1
+        delay = max(self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+        await asyncio.sleep(delay)
+        if route in self.failing_routes:
+            return web.json_response({'error': 'internal'}, status=500)
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            status = 429 if route.startswith('/coingecko') else 503
+            return web.json_response({'error': 'throttled'}, status=status, headers={'Retry-After': '1'})
+        if roll < self.throttle_rate + self.error_rate:
+            return web.json_response({'error': 'internal'}, status=500)
+        return await handler(request)
+
+    async def coins_markets(self, request):
+        ids = request.query.get('ids')
+        coins = [c for c in BENCH_COINS if not ids or c[0] in ids.split(',')]
+        rng = np.random.default_rng(len(coins))
+        data = []
+        for rank, (coin_id, symbol, name) in enumerate(coins):
+            item = {'id': coin_id, 'symbol': symbol, 'name': name, 'current_price': 100.0 + rank,
+                    'market_cap_rank': rank + 1, 'price_change_percentage_24h': float(rng.normal(2, 5))}
+            if request.query.get('sparkline') == 'true':
+                item['sparkline_in_7d'] = {'price': (100 * np.exp(np.cumsum(rng.normal(0, 0.01, 168)))).tolist()}
+            data.append(item)
+        return web.json_response(data)
+
+    async def coins_list(self, request):
+        return web.json_response([{'id': c[0], 'symbol': c[1], 'name': c[2]} for c in BENCH_COINS])
+
+    async def market_chart(self, request):
+        coin_id = request.match_info['coin_id']
+        if coin_id not in {c[0] for c in BENCH_COINS}:
+            return web.json_response({'error': 'coin not found'}, status=404)
+        now_ms = time.time() * 1000
+        if 'from' in request.query:
+            start_ms = float(request.query['from']) * 1000
+        else:
+            start_ms = now_ms - float(request.query.get('days', 90)) * 86400 * 1000
+        timestamps = np.arange(start_ms, now_ms, 3600 * 1000)
+        prices = 100 * np.exp(np.cumsum(np.random.default_rng(len(timestamps)).normal(0, 0.01, len(timestamps))))
+        return web.json_response({'prices': np.column_stack([timestamps, prices]).tolist()})
+
+    async def economic_calendar(self, request):
+        today = time.strftime('%Y-%m-%d')
+        rows = ["releaseDate,releaseTime,country,event,impact"]
+        rows += [f"{today},14:00,US,{name},high" for name in ("FOMC Meeting", "Fed Chair Speech", "Inflation Rate YoY", "Retail Sales")]
+        return web.Response(text="\n".join(rows) + "\n", content_type='text/csv')
+
+    async def fear_greed(self, request):
+        now = int(time.time())
+        data = [{'value': str(40 + day % 30), 'value_classification': 'Greed', 'timestamp': str(now - day * 86400)}
+                for day in range(int(request.query.get('limit', 1)))]
+        data[0]['time_until_update'] = '3600'
+        return web.json_response({'data': data})
+
+    async def rss(self, request):
+        self.news_counter += NEWS_PER_POLL
+        items = []
+        for n in range(self.news_counter, max(self.news_counter - 5, 0), -1):
+            items.append(
+                f"<item><title>Bitcoin headline number {n} @WatcherGuru</title>"
+                f"<link>{self.base_url}/news/{n}</link>"
+                f"<description><![CDATA[<p>Story {n}</p><img src=\"{self.base_url}/img/{n}.png\"/>]]></description></item>"
+            )
+        body = f"<?xml version=\"1.0\"?><rss version=\"2.0\"><channel><title>Bench</title>{''.join(items)}</channel></rss>"
+        return web.Response(text=body, content_type='application/rss+xml')
+
+
+class FakeGeminiModels:
+    """Atrapa `client.aio.models` - opóźnienie, błędy 503/429 i odpowiedzi JSON dla tłumaczeń."""
+
+    def __init__(self, latency_ms, error_rate, seed, calls):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = calls
+
+    async def generate_content(self, model, contents, config=None):
+        from google.genai import errors
+        self.calls[f"gemini:{model}"] += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        if self.random.random() < self.error_rate:
+            raise errors.APIError(503, {'error': {'code': 503, 'message': 'overloaded', 'status': 'UNAVAILABLE'}})
+        if config is not None and getattr(config, 'response_mime_type', None) == 'application/json':
+            payload = json.loads(contents[contents.rindex('\n\n') + 2:])
+            return SimpleNamespace(text=json.dumps([{'id': item['id'], 'pl': f"PL: {item['en']}"} for item in payload]))
+        return SimpleNamespace(text=f"- Punkt analizy z modelu {model}\n- Drugi punkt")
+
+
+class FakeGeminiClient:
+    def __init__(self, latency_ms, error_rate, seed, calls):
+        self.aio = SimpleNamespace(models=FakeGeminiModels(latency_ms, error_rate, seed, calls))
+
+
+# --- Atrapy obiektów Discorda ---
+
+class StubChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+        return SimpleNamespace(id=len(self.sent))
+
+
+class StubInteractionResponse:
+    async def defer(self, **kwargs):
+        pass
+
+    async def send_message(self, content=None, **kwargs):
+        pass
+
+
+class StubInteraction:
+    def __init__(self, discord_module):
+        self.created_at = discord_module.utils.utcnow()
+        self.response = StubInteractionResponse()
+        self.followup = StubChannel()
+        self.user = SimpleNamespace(id=0, name="benchmark")
+
+
+# --- Pomiar ---
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_scenario(name, call, iterations, concurrency, calls):
+    durations = []
+    calls_before = sum(calls.values())
+    for i in range(iterations):
+        async def timed(j):
+            started = time.perf_counter()
+            await call(i * concurrency + j)
+            durations.append(time.perf_counter() - started)
+        await asyncio.gather(*(timed(j) for j in range(concurrency)))
+    invocations = iterations * concurrency
+    return {
+        'invocations': invocations,
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 2),
+        'upstream_calls_per_invocation': round((sum(calls.values()) - calls_before) / invocations, 3),
+    }
+
+
+async def check_failed_snapshot_source(bot, upstreams):
+    """
+    Kontrola poprawności: gdy CoinGecko nie działa, snapshot ma być niepełny (a nie
+    zawierać komunikat o błędzie jako dane), a analiza AI takiego snapshotu nie może
+    trafić do pamięci analiz. Zwraca listę błędów.
+    """
+    errors = []
+    upstreams.failing_routes.add('/coingecko/coins/markets')
+    try:
+        snapshot = await bot._build_market_snapshot()
+        if not snapshot.is_partial or 'top_gainers' not in snapshot.missing_sources:
+            errors.append(f"snapshot bez danych CoinGecko nie jest oznaczony jako niepełny (top_gainers={snapshot.top_gainers!r})")
+        cached_before = len(bot.ai_analysis_cache._entries)
+        await bot.generate_market_analysis(bot.AI_REPORT_PROMPT_TEMPLATE, snapshot)
+        if len(bot.ai_analysis_cache._entries) != cached_before:
+            errors.append("analiza AI niepełnego snapshotu trafiła do pamięci analiz")
+    finally:
+        upstreams.failing_routes.clear()
+        bot.http_client._breakers.clear() # Wymuszone błędy nie mogą otwierać bezpiecznika dla scenariuszy
+        # Scenariusze startują z pustą pamięcią, jak bez tej kontroli
+        bot.fear_greed_cache._entries.clear()
+        bot.watcher_guru_feed.last_checked = None
+    return errors
+
+
+async def run_benchmark(args):
+    calls = Counter()
+    upstreams = FakeUpstreams(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.seed)
+    upstreams.calls = calls
+    await upstreams.start()
+
+    # Bot czyta konfigurację przy imporcie, więc środowisko ustawiamy przed `import bot`
+    os.environ.update({
+        'BOT_MODE': 'web',
+        'COINGECKO_API_KEY': 'benchmark', 'ALPHAVANTAGE_API_KEY': 'benchmark',
+        'COINGECKO_API_URL': f"{upstreams.base_url}/coingecko",
+        'ALPHAVANTAGE_API_URL': f"{upstreams.base_url}/alphavantage/query",
+        'FEAR_GREED_API_URL': f"{upstreams.base_url}/fng/",
+        'WATCHER_GURU_RSS_URL': f"{upstreams.base_url}/rss",
+        'GEMINI_PRO_RPM': '100000', 'GEMINI_FLASH_RPM': '100000',
+    })
+    os.environ.pop('GEMINI_API_KEY', None)
+    import discord
+    import bot
+
+    bot.gemini_client = FakeGeminiClient(args.gemini_latency_ms, args.gemini_error_rate, args.seed, calls)
+    channel = StubChannel()
+    bot.bot.get_channel = lambda channel_id: channel
+    bot.WATCHER_GURU_SENT_URLS.load()
+    bot.translation_cache.load()
+    await bot.coin_index.refresh()
+    check_errors = await check_failed_snapshot_source(bot, upstreams)
+    calls.clear()
+
+    scenarios = {
+        'market_report': lambda i: bot.send_market_report(
+            channel, "Benchmark", discord.Color.gold(),
+            include_fg=True, include_gainers=True, include_fed=True, include_ai_analysis=True),
+        'slash_analysis': lambda i: bot.slash_analysis.callback(
+            StubInteraction(discord), ANALYSIS_INPUTS[i % len(ANALYSIS_INPUTS)]),
+        'watcher_guru_forwarder': lambda i: bot.watcher_guru_forwarder.coro(),
+        'ai_analysis_embed': lambda i: bot.get_detailed_ai_analysis_embed(),
+    }
+    results = {}
+    try:
+        for name in args.scenarios:
+            results[name] = await run_scenario(name, scenarios[name], args.iterations, args.concurrency, calls)
+            results[name]['upstream_calls'] = dict(sorted(calls.items()))
+            calls.clear()
+    finally:
+        await bot.http_client.close()
+        await upstreams.stop()
+    return results, check_errors
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Zwraca listę regresji: wolniejszy p95 lub więcej zapytań do API niż w bazie (z tolerancją)."""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if current['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms > {reference['p95_ms']} ms (+{tolerance:.0%})")
+        if current['upstream_calls_per_invocation'] > reference['upstream_calls_per_invocation'] * (1 + tolerance):
+            regressions.append(f"{name}: zapytania do API {current['upstream_calls_per_invocation']} > "
+                               f"{reference['upstream_calls_per_invocation']} na wywołanie")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'scenariusz':<24}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'API/wyw.':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['invocations']:>5}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['upstream_calls_per_invocation']:>10}")
+        print(f"{'':<24}{r['upstream_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny benchmark bota z atrapami zewnętrznych API.")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1, help="Równoległe wywołania w każdej iteracji")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--latency-ms', type=float, default=50, help="Średnie opóźnienie atrap API")
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Odsetek odpowiedzi 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Odsetek odpowiedzi 429 (CoinGecko) / 503")
+    parser.add_argument('--gemini-latency-ms', type=float, default=300)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help="Odsetek odpowiedzi 503 z Gemini")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Zapisz wyniki do pliku JSON")
+    parser.add_argument('--baseline', help="Porównaj z wynikami bazowymi (JSON); regresja = kod wyjścia 1")
+    parser.add_argument('--save-baseline', help="Zapisz wyniki jako nową bazę")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Dopuszczalny wzrost względem bazy")
+    args = parser.parse_args()
+
+    # Bot zapisuje pliki (historia cen, dzienniki, pamięć tłumaczeń) względem katalogu roboczego
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for path_arg in ('output', 'baseline', 'save_baseline'):
+        if getattr(args, path_arg):
+            setattr(args, path_arg, os.path.abspath(getattr(args, path_arg)))
+    workdir = tempfile.mkdtemp(prefix="bot-benchmark-")
+    os.chdir(workdir)
+
+    results, check_errors = asyncio.run(run_benchmark(args))
+    print_results(results)
+    if check_errors:
+        print("\nBŁĄD KONTROLI POPRAWNOŚCI:")
+        for line in check_errors:
+            print(f"- {line}")
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nZapisano bazę: {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESJA:")
+            for line in regressions:
+                print(f"- {line}")
+            sys.exit(1)
+        print("\nBrak regresji względem bazy.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,42 @@
 # OSTATECZNA WERSJA: Łączy Flask (dla Gunicorn) i Bota Discord (w wątku).
 
 import os
+import sys
+import atexit
+import fcntl
 import discord
 from discord.ext import commands, tasks
-import requests
+import aiohttp
 import datetime
 from datetime import date, timedelta
 import csv
 import io
 import feedparser
 import time
+from calendar import timegm
 import numpy as np
+import indicators
+import metrics
+import functools
 from bs4 import BeautifulSoup
-from collections import deque
+from PIL import Image, ImageDraw, ImageFont
+from collections import namedtuple, OrderedDict, deque
+from urllib.parse import urlsplit
 import asyncio
 from zoneinfo import ZoneInfo
-from threading import Thread # <-- WAŻNE: Importujemy wątki
-from flask import Flask # <-- WAŻNE: Importujemy Flask
+from threading import Thread, Event, Lock, get_ident # <-- WAŻNE: Importujemy wątki
+from flask import Flask, jsonify, Response # <-- WAŻNE: Importujemy Flask
 import json # <-- DODANO IMPORT DLA TRWAŁEJ PAMIĘCI
+import itertools
+import hashlib
+import heapq
+import random
+import re
+import bisect
+import math
+import traceback
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Wymaga instalacji: google-genai
 from google import genai
@@ -35,8 +54,29 @@ def home():
 
 @app.route('/healthz')
 def health_check():
-    """Endpoint dla Render Health Check."""
-    return "OK", 200
+    """Endpoint dla Render Health Check - zwraca faktyczny stan bota (także z innego workera)."""
+    state = get_bot_state()
+    now = time.time()
+    if state is None:
+        # Tuż po starcie bot może jeszcze nie mieć lidera ani pierwszego heartbeatu
+        if now - PROCESS_STARTED_AT < BOT_STARTUP_GRACE_SECONDS:
+            return jsonify({"status": "starting"}), 200
+        return jsonify({"status": "down", "reason": "brak stanu bota"}), 503
+    alive = now - state.get("heartbeat", 0) < BOT_STATE_STALE_SECONDS
+    if state.get("fatal"):
+        # Np. zły token: bot nie wystartuje sam, potrzebna interwencja
+        return jsonify({"status": "down", "reason": state["fatal"], **state}), 503
+    if state.get("ready") and alive:
+        return jsonify({"status": "ok", **state}), 200
+    # Lider żyje, ale bot dopiero się łączy albo czeka na ponowny start (przerwa po awarii)
+    if alive and now - state.get("connecting_since", 0) < BOT_STARTUP_GRACE_SECONDS:
+        return jsonify({"status": "starting", **state}), 200
+    return jsonify({"status": "degraded", **state}), 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metryki w formacie Prometheusa; workery bez bota serwują ostatni zrzut lidera."""
+    return Response(get_metrics_text(), content_type=metrics.CONTENT_TYPE)
 
 # --- Konfiguracja Bota Discord ---
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
@@ -52,27 +92,664 @@ else:
 # --- Reszta Konfiguracji ---
 CHANNEL_ID = 1429744335389458452
 WATCHER_GURU_CHANNEL_ID = 1429719129702535248 
-WATCHER_GURU_RSS_URL = "https://watcher.guru/feed"
+# Adresy API można nadpisać zmiennymi środowiskowymi (np. lokalne atrapy w benchmark.py)
+WATCHER_GURU_RSS_URL = os.environ.get('WATCHER_GURU_RSS_URL', "https://watcher.guru/feed")
+COINGECKO_API_URL = os.environ.get('COINGECKO_API_URL', "https://api.coingecko.com/api/v3")
+ALPHAVANTAGE_API_URL = os.environ.get('ALPHAVANTAGE_API_URL', "https://www.alphavantage.co/query")
+FEAR_GREED_API_URL = os.environ.get('FEAR_GREED_API_URL', "https://api.alternative.me/fng/")
+# Kanały wiadomości: "Nazwa=URL" rozdzielone średnikami; kolejność = priorytet przy duplikatach
+NEWS_FEEDS = os.environ.get('NEWS_FEEDS', f"Watcher Guru={WATCHER_GURU_RSS_URL}")
+
+SENT_URLS_FILE = "sent_urls.json" # <-- NOWA LINIA: Nazwa pliku dla pamięci (stary format, importowany raz)
+SENT_URLS_JOURNAL_FILE = "sent_urls.bin" # Dziennik skrótów wysłanych URL-i (append-only)
+SENT_URLS_MAX_ENTRIES = 50000 # Horyzont pamięci duplikatów
+TRANSLATION_CACHE_FILE = "translations_cache.json" # Trwała pamięć tłumaczeń nagłówków
+TRANSLATION_CACHE_MAX_ENTRIES = 5000
+
+class SentUrlStore:
+    """
+    Pamięć wysłanych URL-i: indeks haszujący (sprawdzenie w O(1)) i dziennik
+    append-only z 8-bajtowymi skrótami URL-i. `add` zmienia tylko pamięć, a `flush`
+    (raz na cykl, w puli 'parsing') dopisuje zaległe rekordy jednym fsync; gdy
+    dziennik urośnie ponad 2x limit, jest kompaktowany atomowo.
+    """
 
-WATCHER_GURU_SENT_URLS = deque(maxlen=200)
-SENT_URLS_FILE = "sent_urls.json" # <-- NOWA LINIA: Nazwa pliku dla pamięci
+    RECORD_SIZE = 8
+
+    def __init__(self, path, max_entries, legacy_path=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.legacy_path = legacy_path
+        self._index = OrderedDict() # skrót -> None; kolejność = od najstarszego
+        self._journal_records = 0
+        self._journal = None
+        self._loaded = False
+        self._pending = [] # Skróty dodane w pamięci, jeszcze nie zapisane w dzienniku
+        self._lock = Lock() # add() działa w pętli zdarzeń, flush() w wątku puli
+        self._io_lock = Lock()
+
+    @classmethod
+    def _digest(cls, url):
+        return hashlib.blake2b(url.encode('utf-8'), digest_size=cls.RECORD_SIZE).digest()
+
+    def __contains__(self, url):
+        return self._digest(url) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def _remember(self, key):
+        # Wywoływane pod self._lock (albo przy wczytywaniu, zanim ktokolwiek dodaje)
+        self._index[key] = None
+        self._index.move_to_end(key)
+        while len(self._index) > self.max_entries:
+            self._index.popitem(last=False)
+
+    def load(self):
+        """Wczytuje dziennik raz na proces (ponowne połączenia z Discordem go nie przeładowują)."""
+        if self._loaded: return
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._import_legacy()
+            return
+        except Exception as e:
+            print(f"Błąd ładowania URL-i z pliku: {e}")
+            return
 
-def load_sent_urls_from_file():
-    """Wczytuje URL-e z pliku do globalnego deque przy starcie."""
-    global WATCHER_GURU_SENT_URLS # Używamy globalnej zmiennej
-    try:
-        with open(SENT_URLS_FILE, 'r') as f:
-            urls_list = json.load(f)
-            # Nadpisujemy domyślne puste deque zawartością pliku
-            WATCHER_GURU_SENT_URLS = deque(urls_list, maxlen=200)
-            print(f"Załadowano {len(WATCHER_GURU_SENT_URLS)} URL-i z pliku {SENT_URLS_FILE}.")
-    except FileNotFoundError:
-        print(f"Plik {SENT_URLS_FILE} nie znaleziony, startuję z pustą listą.")
-    except Exception as e:
-        print(f"Błąd ładowania URL-i z pliku: {e}")
+        # Ucięty ostatni rekord (np. po awarii w trakcie zapisu) pomijamy
+        usable = len(data) - len(data) % self.RECORD_SIZE
+        for offset in range(0, usable, self.RECORD_SIZE):
+            self._remember(data[offset:offset + self.RECORD_SIZE])
+        self._journal_records = usable // self.RECORD_SIZE
+        if usable != len(data):
+            self.compact()
+        print(f"Załadowano {len(self._index)} URL-i z pliku {self.path}.")
+
+    def _import_legacy(self):
+        if not self.legacy_path:
+            print(f"Plik {self.path} nie znaleziony, startuję z pustą listą.")
+            return
+        try:
+            with open(self.legacy_path, 'r') as f:
+                for url in json.load(f):
+                    self._remember(self._digest(url))
+            self.compact()
+            print(f"Zaimportowano {len(self._index)} URL-i z pliku {self.legacy_path}.")
+        except FileNotFoundError:
+            print(f"Plik {self.path} nie znaleziony, startuję z pustą listą.")
+        except Exception as e:
+            print(f"Błąd importu URL-i z pliku {self.legacy_path}: {e}")
+
+    def add(self, url):
+        """Zapamiętuje URL w pamięci; rekord trafi do dziennika przy najbliższym flush()."""
+        key = self._digest(url)
+        with self._lock:
+            if key in self._index: return
+            self._remember(key)
+            self._pending.append(key)
+
+    def flush(self):
+        """Dopisuje zaległe rekordy jednym zapisem z fsync (operacja blokująca - poza pętlą zdarzeń)."""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending: return
+            try:
+                if self._journal_records + len(pending) > 2 * self.max_entries:
+                    self.compact()
+                    return
+                if self._journal is None:
+                    self._journal = open(self.path, 'ab')
+                self._journal.write(b"".join(pending))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal_records += len(pending)
+            except Exception as e:
+                print(f"KRYTYCZNY BŁĄD zapisu URL-i do pliku: {e}")
+                with self._lock:
+                    self._pending = pending + self._pending # Spróbujemy w kolejnym cyklu
+
+    def compact(self):
+        """Przepisuje dziennik do aktualnej zawartości indeksu (plik tymczasowy + os.replace)."""
+        with self._lock:
+            keys = list(self._index)
+            covered, self._pending = self._pending, [] # Są już w migawce indeksu
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(b"".join(keys))
+                f.flush()
+                os.fsync(f.fileno())
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            os.replace(tmp_path, self.path)
+        except Exception:
+            # Dziennik bez zmian (_journal_records też), zaległe rekordy wracają do kolejki
+            with self._lock:
+                self._pending = covered + self._pending
+            raise
+        self._journal_records = len(keys)
+
+WATCHER_GURU_SENT_URLS = SentUrlStore(SENT_URLS_JOURNAL_FILE, SENT_URLS_MAX_ENTRIES, legacy_path=SENT_URLS_FILE)
 
 TZ_POLAND = ZoneInfo("Europe/Warsaw")
 
+# --- POCZĄTEK BLOKU: WSPÓLNY ASYNCHRONICZNY KLIENT HTTP ---
+
+HTTP_TIMEOUT_SECONDS = 10 # Jeden, wspólny limit czasu dla wszystkich zapytań
+HTTP_MAX_CONNECTIONS = 50 # Rozmiar całej puli połączeń
+HTTP_MAX_CONCURRENCY_PER_HOST = 4 # Ile równoległych zapytań wolno wysłać do jednego hosta
+HTTP_KEEPALIVE_SECONDS = 75 # Jak długo trzymamy "ciepłe" połączenia TLS
+
+MARKET_CACHE_TTL_SECONDS = int(os.environ.get('MARKET_CACHE_TTL', 120)) # Dane /coins/markets są świeże przez 2 min
+MARKET_CACHE_STALE_SECONDS = int(os.environ.get('MARKET_CACHE_STALE', 600)) # Potem jeszcze 10 min serwujemy je, odświeżając w tle
+
+# Bezpieczniki (circuit breaker) per host
+CIRCUIT_WINDOW_SECONDS = 60 # Okno, w którym liczymy odsetek błędów
+CIRCUIT_MIN_REQUESTS = 5 # Poniżej tylu zapytań w oknie bezpiecznik się nie otwiera
+CIRCUIT_FAILURE_RATIO = 0.5
+CIRCUIT_OPEN_SECONDS = 30 # Po tym czasie wpuszczamy jedno zapytanie próbne
+CIRCUIT_MAX_OPEN_SECONDS = 300 # Każda nieudana próba podwaja przerwę, do tego limitu
+
+HttpResponse = namedtuple("HttpResponse", ["status", "headers", "body"])
+
+UPSTREAM_LATENCY = metrics.REGISTRY.histogram(
+    'upstream_request_duration_seconds', 'Czas zapytań HTTP do zewnętrznych API.', ['host', 'status'])
+
+CIRCUIT_STATE = metrics.REGISTRY.gauge('circuit_state', 'Stan bezpiecznika hosta (0 zamknięty, 1 próba, 2 otwarty).', ['host'])
+CIRCUIT_REJECTED = metrics.REGISTRY.counter('circuit_rejected_total', 'Zapytania odrzucone od razu przez otwarty bezpiecznik.', ['host'])
+
+class CircuitOpenError(Exception):
+    """Host jest uznany za niedostępny - zapytanie odrzucone bez łączenia się z nim."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"Usługa {host} jest chwilowo niedostępna (ponowna próba za {retry_in:.0f}s).")
+        self.host = host
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Bezpiecznik dla jednego hosta. Gdy w oknie CIRCUIT_WINDOW_SECONDS odsetek
+    błędów (timeouty, błędy połączenia, 5xx, 429) przekroczy próg, kolejne
+    zapytania od razu dostają CircuitOpenError. Po przerwie przepuszczamy
+    jedno zapytanie próbne: sukces zamyka bezpiecznik, błąd otwiera go na dłużej.
+    """
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, host):
+        self.host = host
+        self.state = self.CLOSED
+        self._results = deque() # (czas, czy sukces)
+        self._open_seconds = CIRCUIT_OPEN_SECONDS
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state], host=self.host)
+
+    def before_request(self):
+        """Rzuca CircuitOpenError, jeśli zapytanie nie może teraz wyjść do hosta."""
+        if self.state == self.CLOSED:
+            return
+        retry_in = self._opened_at + self._open_seconds - time.monotonic()
+        if self.state == self.OPEN and retry_in <= 0:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        CIRCUIT_REJECTED.inc(host=self.host)
+        raise CircuitOpenError(self.host, max(retry_in, 0))
+
+    def record(self, success):
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if success:
+                print(f"[Bezpiecznik] {self.host} znów odpowiada, zamykam bezpiecznik.")
+                self._results.clear()
+                self._open_seconds = CIRCUIT_OPEN_SECONDS
+                self._set_state(self.CLOSED)
+            else:
+                self._open(now, min(self._open_seconds * 2, CIRCUIT_MAX_OPEN_SECONDS))
+            return
+
+        self._results.append((now, success))
+        while self._results and self._results[0][0] < now - CIRCUIT_WINDOW_SECONDS:
+            self._results.popleft()
+        failures = sum(1 for _, ok in self._results if not ok)
+        if (self.state == self.CLOSED and len(self._results) >= CIRCUIT_MIN_REQUESTS
+                and failures / len(self._results) >= CIRCUIT_FAILURE_RATIO):
+            self._open(now, CIRCUIT_OPEN_SECONDS)
+
+    def abandon(self):
+        """Zapytanie przerwane (np. anulowane) - nie liczy się ani jako sukces, ani jako błąd."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self, now, seconds):
+        print(f"[Bezpiecznik] {self.host} nie odpowiada poprawnie, otwieram bezpiecznik na {seconds}s.")
+        self._opened_at = now
+        self._open_seconds = seconds
+        self._set_state(self.OPEN)
+
+def _is_upstream_failure_status(status):
+    """Czy kod odpowiedzi świadczy o problemie po stronie hosta (a nie o złym zapytaniu, jak 404)."""
+    return status >= 500 or status == 429
+
+def is_transient_upstream_error(error):
+    """Błędy, przy których warto podać ostatnie dobre dane zamiast komunikatu o błędzie."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return _is_upstream_failure_status(error.status)
+    return isinstance(error, (CircuitOpenError, TimeoutError, aiohttp.ClientError))
+
+def _upstream_status(error):
+    """Etykieta 'status' dla nieudanego zapytania: kod HTTP albo nazwa wyjątku."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return str(error.status)
+    return type(error).__name__
+
+class AsyncHttpClient:
+    """
+    Jeden, współdzielony klient HTTP (aiohttp) dla wszystkich zapytań bota.
+    Trzyma pulę połączeń keep-alive, limituje równoległość per host
+    i stosuje wspólne timeouty, więc żadna komenda nie blokuje pętli Discorda.
+    """
+
+    def __init__(self, timeout=HTTP_TIMEOUT_SECONDS, max_connections=HTTP_MAX_CONNECTIONS,
+                 max_per_host=HTTP_MAX_CONCURRENCY_PER_HOST, keepalive=HTTP_KEEPALIVE_SECONDS):
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_connections = max_connections
+        self._max_per_host = max_per_host
+        self._keepalive = keepalive
+        self._session = None
+        self._host_limits = {}
+        self._breakers = {}
+
+    def _breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    def circuit_states(self):
+        """Hosty z bezpiecznikiem innym niż zamknięty (do /healthz)."""
+        return {host: b.state for host, b in self._breakers.items() if b.state != CircuitBreaker.CLOSED}
+
+    def _get_session(self):
+        # Sesję tworzymy leniwie, bo musi powstać wewnątrz pętli zdarzeń bota
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._max_connections,
+                limit_per_host=self._max_per_host,
+                keepalive_timeout=self._keepalive,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    def _host_limit(self, host):
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(self._max_per_host)
+        return semaphore
+
+    async def get(self, url, params=None, headers=None, timeout=None, raise_for_status=True):
+        """Wykonuje GET i zwraca HttpResponse (status, nagłówki, surowe bajty)."""
+        session = self._get_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self._timeout
+        host = urlsplit(url).hostname
+        breaker = self._breaker(host)
+        async with self._host_limit(host):
+            # Dopiero po zajęciu miejsca: próba półotwartego bezpiecznika nie może utknąć w kolejce
+            # (anulowanie w trakcie czekania zostawiłoby ją "w locie" na zawsze)
+            breaker.before_request() # Otwarty bezpiecznik: błąd od razu, bez czekania na timeout
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=request_timeout) as response:
+                    body = await response.read()
+                    status = str(response.status)
+                    breaker.record(not _is_upstream_failure_status(response.status))
+                    if raise_for_status:
+                        response.raise_for_status()
+                    return HttpResponse(response.status, response.headers, body)
+            except Exception as e:
+                if status == 'error':
+                    status = _upstream_status(e)
+                    breaker.record(False)
+                raise
+            finally:
+                if status == 'error':
+                    breaker.abandon()
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, host=host, status=status)
+
+    async def iter_lines(self, url, params=None, headers=None, timeout=None):
+        """Strumieniuje odpowiedź linia po linii (bez trzymania całego body w pamięci)."""
+        session = self._get_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self._timeout
+        host = urlsplit(url).hostname
+        breaker = self._breaker(host)
+        async with self._host_limit(host):
+            breaker.before_request() # Po zajęciu miejsca - jak w get()
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=request_timeout) as response:
+                    status = str(response.status)
+                    breaker.record(not _is_upstream_failure_status(response.status))
+                    response.raise_for_status()
+                    async for line in response.content:
+                        yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+            except Exception as e:
+                if status == 'error':
+                    status = _upstream_status(e)
+                    breaker.record(False)
+                raise
+            finally:
+                if status == 'error':
+                    breaker.abandon()
+                # Mierzymy do końca strumienia (lub do przerwania go przez czytającego)
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, host=host, status=status)
+
+    async def get_json(self, url, **kwargs):
+        response = await self.get(url, **kwargs)
+        return json.loads(response.body)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._host_limits = {}
+
+http_client = AsyncHttpClient()
+
+# --- KONIEC BLOKU: WSPÓLNY ASYNCHRONICZNY KLIENT HTTP ---
+
+# --- POCZĄTEK BLOKU: ODDZIELNE PULE ROBOCZE (BULKHEADS) ---
+# Każda zależność ma własną, ograniczoną pulę zamiast wspólnego executora asyncio.to_thread.
+# Awaria Gemini (długie ponowienia) zajmuje tylko pulę AI, a analizy CoinGecko działają dalej.
+
+class BulkheadFullError(Exception):
+    """Pula jest pełna (także kolejka) - komenda interaktywna dostaje od razu odpowiedź "zajęte"."""
+
+BULKHEAD_ACTIVE = metrics.REGISTRY.gauge('bulkhead_active', 'Zadania wykonywane w puli.', ['pool'])
+BULKHEAD_QUEUED = metrics.REGISTRY.gauge('bulkhead_queued', 'Zadania czekające w kolejce puli.', ['pool'])
+BULKHEAD_UTILIZATION = metrics.REGISTRY.gauge('bulkhead_utilization', 'Zajętość puli (aktywne / maksimum).', ['pool'])
+BULKHEAD_REJECTED = metrics.REGISTRY.counter('bulkhead_rejected_total', 'Zadania odrzucone, bo pula była pełna.', ['pool'])
+
+class Bulkhead:
+    """
+    Ograniczona pula dla jednej zależności: najwyżej `max_concurrent` zadań naraz
+    i `max_queue` czekających. Zadania interaktywne przy pełnej puli dostają od razu
+    BulkheadFullError, zadania w tle czekają (kolejka i tak nie rośnie ponad limit).
+    `run` wykonuje funkcję synchroniczną we własnych wątkach puli, `run_async` - korutynę.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._admission = asyncio.Semaphore(max_concurrent + max_queue)
+        self._executor = None
+
+    def _update_gauges(self):
+        BULKHEAD_ACTIVE.set(self.active, pool=self.name)
+        BULKHEAD_QUEUED.set(self.queued, pool=self.name)
+        BULKHEAD_UTILIZATION.set(self.active / self.max_concurrent, pool=self.name)
+
+    @contextlib.asynccontextmanager
+    async def _admit(self, interactive):
+        if interactive and self._admission.locked():
+            BULKHEAD_REJECTED.inc(pool=self.name)
+            raise BulkheadFullError(f"Pula '{self.name}' jest pełna, spróbuj ponownie za chwilę.")
+        async with self._admission:
+            self.queued += 1
+            self._update_gauges()
+            try:
+                await self._slots.acquire()
+            finally:
+                self.queued -= 1
+            self.active += 1
+            self._update_gauges()
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self._slots.release()
+                self._update_gauges()
+
+    async def run(self, func, *args, interactive=False):
+        async with self._admit(interactive):
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix=f"bulkhead-{self.name}")
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def run_async(self, coro_func, *args, interactive=False, **kwargs):
+        async with self._admit(interactive):
+            return await coro_func(*args, **kwargs)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Gemini jest wywoływane asynchronicznie, więc pula AI ogranicza równoległe wywołania (bez wątków)
+AI_BULKHEAD = Bulkhead('ai', int(os.environ.get('AI_BULKHEAD_CONCURRENCY', 4)), 16)
+MARKET_DATA_BULKHEAD = Bulkhead('market_data', 4, 32) # Historia cen i indeks monet (NumPy, dysk)
+PARSING_BULKHEAD = Bulkhead('parsing', 2, 32) # RSS (feedparser), HTML (BeautifulSoup), pamięć tłumaczeń
+BULKHEADS = (AI_BULKHEAD, MARKET_DATA_BULKHEAD, PARSING_BULKHEAD)
+
+# --- KONIEC BLOKU: ODDZIELNE PULE ROBOCZE (BULKHEADS) ---
+
+# --- POCZĄTEK BLOKU: PAMIĘĆ PODRĘCZNA Z TTL (SINGLE-FLIGHT) ---
+
+CACHE_REQUESTS = metrics.REGISTRY.counter(
+    'cache_requests_total', 'Odczyty pamięci podręcznej wg wyniku (hit/stale/miss).', ['cache', 'result'])
+
+class AsyncTtlCache:
+    """
+    Pamięć podręczna z TTL i trybem stale-while-revalidate.
+    Równoległe chybienia dla tego samego klucza są łączone w jedno
+    pobranie (single-flight), więc 20 wywołań naraz = 1 zapytanie do API.
+    """
+
+    def __init__(self, ttl, stale_ttl=0, max_entries=256, name="cache", ttl_for=None):
+        self.name = name
+        self.ttl = ttl
+        self.ttl_for = ttl_for # Opcjonalnie: TTL wyliczany z samej wartości (np. z nagłówka API)
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # klucz -> (wartość, czas pobrania, datetime pobrania)
+        self._inflight = {} # klucz -> trwające zadanie pobierania
+
+    async def get_or_fetch(self, key, fetcher):
+        """Zwraca wartość z pamięci lub pobiera ją przez `fetcher` (funkcja zwracająca korutynę)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at, _ = entry
+            age = time.monotonic() - fetched_at
+            if age < (self.ttl_for(value) if self.ttl_for else self.ttl):
+                CACHE_REQUESTS.inc(cache=self.name, result='hit')
+                return value
+            if age < (self.ttl_for(value) if self.ttl_for else self.ttl) + self.stale_ttl:
+                # Dane lekko nieświeże: oddajemy od razu, a odświeżamy w tle
+                CACHE_REQUESTS.inc(cache=self.name, result='stale')
+                self._start_fetch(key, fetcher)
+                return value
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        # shield: anulowanie jednego czekającego nie przerywa wspólnego pobrania
+        return await asyncio.shield(self._start_fetch(key, fetcher))
+
+    async def get_with_fallback(self, key, fetcher):
+        """
+        Jak get_or_fetch, ale gdy pobranie zawiedzie z przejściowego powodu (np. otwarty
+        bezpiecznik), oddaje ostatnią dobrą wartość. Zwraca (wartość, stan_na), gdzie
+        stan_na to datetime ostatniego udanego pobrania albo None dla świeżych danych.
+        """
+        try:
+            return await self.get_or_fetch(key, fetcher), None
+        except Exception as e:
+            entry = self._entries.get(key)
+            if entry is None or not is_transient_upstream_error(e):
+                raise
+            print(f"[{self.name}] Źródło niedostępne ({e}), podaję dane z {entry[2]:%Y-%m-%d %H:%M}.")
+            return entry[0], entry[2]
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def _start_fetch(self, key, fetcher):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(key, fetcher))
+            task.add_done_callback(self._log_background_error)
+            self._inflight[key] = task
+        return task
+
+    def peek(self, key):
+        """Zwraca świeżą wartość z pamięci albo None - bez pobierania (gdy pobieraniem zarządza wywołujący)."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < (self.ttl_for(entry[0]) if self.ttl_for else self.ttl):
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return entry[0]
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic(), datetime.datetime.now(TZ_POLAND))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch_and_store(self, key, fetcher):
+        try:
+            value = await fetcher()
+            self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _log_background_error(task):
+        # Odczytujemy wyjątek, aby odświeżanie w tle nie zostawiało ostrzeżeń asyncio
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Blad odswiezania pamieci podrecznej: {task.exception()}")
+
+market_data_cache = AsyncTtlCache(ttl=MARKET_CACHE_TTL_SECONDS, stale_ttl=MARKET_CACHE_STALE_SECONDS, name='coins_markets')
+
+def stale_marker(stale_as_of):
+    """Dopisek dla danych podanych z pamięci, bo źródło jest niedostępne."""
+    return f"\n*⚠️ Źródło niedostępne - dane nieaktualne (stan na {stale_as_of:%Y-%m-%d %H:%M})*" if stale_as_of else ""
+
+async def fetch_coins_markets(params):
+    """
+    Pobiera /coins/markets przez wspólną pamięć podręczną (klucz = parametry zapytania).
+    Zwraca (dane, stan_na) - przy awarii CoinGecko ostatnie dobre dane i czas ich pobrania.
+    """
+    headers = {'x-cg-demo-api-key': COINGECKO_API_KEY.strip()}
+    key = ('coins/markets',) + tuple(sorted(params.items()))
+    return await market_data_cache.get_with_fallback(
+        key,
+        lambda: http_client.get_json(f"{COINGECKO_API_URL}/coins/markets", params=params, headers=headers)
+    )
+
+# --- KONIEC BLOKU: PAMIĘĆ PODRĘCZNA Z TTL (SINGLE-FLIGHT) ---
+
+# --- POCZĄTEK BLOKU: POBIERANIE KANAŁÓW RSS (ZAPYTANIA WARUNKOWE) ---
+
+FEED_POLL_INTERVAL_SECONDS = 300 # Co tyle forwarder sprawdza kanał; snapshot korzysta z tego samego wyniku
+
+class FeedFetcher:
+    """
+    Pobiera kanał RSS zapytaniami warunkowymi (ETag / Last-Modified).
+    Przy odpowiedzi 304 lub niezmienionej treści nic nie jest parsowane,
+    a wszyscy czytelnicy dostają ostatnio sparsowane wpisy z pamięci.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.entries = []
+        self.last_checked = None # time.monotonic() ostatniego zapytania
+        self.last_changed = None # datetime ostatniej faktycznej zmiany treści
+        self._body_hash = None
+        self._lock = asyncio.Lock()
+
+    async def poll(self):
+        """Sprawdza kanał; zwraca True, jeśli treść się zmieniła i została sparsowana."""
+        async with self._lock:
+            return await self._poll_locked()
+
+    async def get_entries(self, max_age=FEED_POLL_INTERVAL_SECONDS):
+        """Zwraca wpisy z pamięci, sprawdzając kanał tylko gdy są starsze niż `max_age` sekund."""
+        async with self._lock:
+            if self.last_checked is None or time.monotonic() - self.last_checked >= max_age:
+                try:
+                    await self._poll_locked()
+                except Exception:
+                    if not self.entries:
+                        raise
+                    print(f"Blad odswiezania RSS {self.url}, uzywam ostatnich wpisow.")
+            return self.entries
+
+    async def _poll_locked(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        response = await http_client.get(self.url, headers=headers)
+        self.last_checked = time.monotonic()
+        if response.status == 304:
+            return False
+
+        self.etag = response.headers.get('ETag', self.etag)
+        self.last_modified = response.headers.get('Last-Modified', self.last_modified)
+
+        # Nie każdy serwer obsługuje 304, więc dodatkowo porównujemy skrót treści
+        body_hash = hashlib.sha1(response.body).digest()
+        if body_hash == self._body_hash:
+            return False
+
+        feed = await PARSING_BULKHEAD.run(feedparser.parse, response.body)
+        self.entries = list(feed.entries)
+        self._body_hash = body_hash
+        self.last_changed = datetime.datetime.now(TZ_POLAND)
+        return True
+
+NewsFeed = namedtuple("NewsFeed", ["name", "fetcher"])
+
+def parse_news_feeds(spec):
+    """Zamienia NEWS_FEEDS ("Nazwa=URL;Nazwa=URL") na listę NewsFeed; ten sam URL to ten sam FeedFetcher."""
+    feeds, fetchers = [], {}
+    for item in spec.split(';'):
+        name, sep, url = item.partition('=')
+        if not sep or not name.strip() or not url.strip():
+            if item.strip():
+                print(f"Pomijam niepoprawny wpis NEWS_FEEDS: {item!r}")
+            continue
+        url = url.strip()
+        if url not in fetchers:
+            fetchers[url] = FeedFetcher(url)
+            feeds.append(NewsFeed(name.strip(), fetchers[url]))
+    return feeds
+
+news_feeds = parse_news_feeds(NEWS_FEEDS)
+# Snapshot rynku czyta nagłówki Watcher Guru; jeśli ten kanał jest na liście, dzielimy z nim pobieranie
+watcher_guru_feed = next((feed.fetcher for feed in news_feeds if feed.fetcher.url == WATCHER_GURU_RSS_URL), None) or FeedFetcher(WATCHER_GURU_RSS_URL)
+
+# --- KONIEC BLOKU: POBIERANIE KANAŁÓW RSS (ZAPYTANIA WARUNKOWE) ---
+
 # --- Konfiguracja Gemini (POPRAWIONA) ---
 gemini_client = None
 gemini_model_name = 'gemini-2.5-pro' # Domyślny model dla ANALIZ
@@ -217,6 +894,265 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+# --- POCZĄTEK BLOKU: MONITOR OPÓŹNIEŃ PĘTLI ZDARZEŃ ---
+# Korutyna w pętli bota "tyka" co LOOP_LAG_INTERVAL_SECONDS, a osobny wątek pilnuje,
+# czy tyknięcia docierają na czas. Gdy pętla stoi dłużej niż próg, wątek zrzuca stos
+# wątku bota (sys._current_frames) - to dokładnie ten synchroniczny kod, który ją blokuje.
+
+LOOP_LAG_INTERVAL_SECONDS = 0.25
+LOOP_LAG_THRESHOLD_SECONDS = float(os.environ.get('LOOP_LAG_THRESHOLD', 0.5))
+LOOP_LAG_MAX_OFFENDERS = 10 # Ile najgorszych miejsc pamiętamy
+LOOP_LAG_STACK_DEPTH = 8 # Ile ramek stosu zachowujemy dla każdego miejsca
+
+LOOP_LAG = metrics.REGISTRY.histogram(
+    'event_loop_lag_seconds', 'Opóźnienie tyknięć pętli zdarzeń bota.',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = metrics.REGISTRY.counter(
+    'event_loop_stalls_total', 'Zablokowania pętli bota powyżej progu, wg funkcji w kodzie bota.', ['location'])
+
+_PROJECT_FILES = ('bot.py', 'indicators.py', 'metrics.py')
+LOOP_STALL_UNKNOWN = "nieznane" # Blokada krótsza niż próbkowanie - nie zdążyliśmy złapać stosu
+LOOP_STALL_OTHER = "inne" # Stos bez ramek z kodu bota
+
+def _stall_location(frames):
+    """
+    Najgłębsza ramka z kodu bota (a nie z bibliotek) - to ją warto poprawić.
+    Zwraca (etykieta metryki, szczegóły): etykieta to tylko moduł.funkcja (skończony
+    zbiór wartości), a plik:linia trafia do logu i listy najgorszych miejsc.
+    """
+    for frame in reversed(frames):
+        filename = os.path.basename(frame.filename)
+        if filename in _PROJECT_FILES:
+            return f"{os.path.splitext(filename)[0]}.{frame.name}", f"{filename}:{frame.lineno} ({frame.name})"
+    frame = frames[-1]
+    return LOOP_STALL_OTHER, f"{os.path.basename(frame.filename)}:{frame.lineno} ({frame.name})"
+
+class LoopWatchdog:
+    """Mierzy opóźnienie pętli zdarzeń i zbiera stosy wywołań, które ją blokują."""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL_SECONDS, threshold=LOOP_LAG_THRESHOLD_SECONDS):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self._last_tick = None
+        self._loop_thread_id = None
+        self._captured = None # (etykieta, lokalizacja, stos) bieżącego zablokowania
+        self._offenders = {} # lokalizacja -> statystyki
+        self._lock = Lock()
+        self._stop = Event()
+        self._tick_task = None
+
+    def start(self, loop):
+        """Wywoływane w wątku bota, zanim pętla zacznie działać."""
+        self._loop_thread_id = get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._tick_task = loop.create_task(self._tick())
+        Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._tick_task:
+            self._tick_task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._last_tick = now
+            self.last_lag = lag
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _watch(self):
+        # Wątek sprawdza częściej niż próg, więc stos łapiemy w trakcie blokady, a nie po niej
+        while not self._stop.wait(min(self.threshold / 4, 0.1)):
+            if self._captured is None and time.monotonic() - self._last_tick > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    frames = traceback.extract_stack(frame)
+                    self._captured = (*_stall_location(frames), traceback.format_list(frames[-LOOP_LAG_STACK_DEPTH:]))
+
+    def _record_stall(self, lag):
+        label, location, stack = self._captured or (LOOP_STALL_UNKNOWN, "nieznane (blokada krótsza niż próbkowanie)", [])
+        self._captured = None
+        LOOP_STALLS.inc(location=label)
+        print(f"[Watchdog] Pętla zdarzeń zablokowana na {lag:.2f}s w {location}")
+        with self._lock:
+            stats = self._offenders.setdefault(location, {'count': 0, 'worst_seconds': 0.0, 'total_seconds': 0.0})
+            stats['count'] += 1
+            stats['total_seconds'] += lag
+            stats['last_seen'] = time.time()
+            if lag >= stats['worst_seconds']:
+                stats['worst_seconds'] = lag
+                stats['stack'] = ''.join(stack)
+            if len(self._offenders) > LOOP_LAG_MAX_OFFENDERS:
+                mildest = min(self._offenders, key=lambda key: self._offenders[key]['worst_seconds'])
+                del self._offenders[mildest]
+
+    def worst_offenders(self, limit=5):
+        with self._lock:
+            ranked = sorted(self._offenders.items(), key=lambda item: item[1]['worst_seconds'], reverse=True)
+            return [
+                {'location': location, **{key: round(value, 3) if isinstance(value, float) else value
+                                          for key, value in stats.items()}}
+                for location, stats in ranked[:limit]
+            ]
+
+loop_watchdog = LoopWatchdog()
+
+# --- KONIEC BLOKU: MONITOR OPÓŹNIEŃ PĘTLI ZDARZEŃ ---
+
+# --- POCZĄTEK BLOKU: JEDEN BOT NA HOST (WYBÓR LIDERA) ---
+# Gunicorn z kilkoma workerami importuje ten plik kilka razy. Bota uruchamia tylko
+# proces, który zdobędzie blokadę pliku (flock); pozostałe workery obsługują wyłącznie
+# Flask i czekają w tle - jeśli lider zginie, blokadę przejmie kolejny worker.
+#   BOT_MODE=auto (domyślnie) - wybór lidera wśród workerów gunicorn
+#   BOT_MODE=web              - ten proces nigdy nie uruchamia bota (bot startuje osobno: `python bot.py`)
+# Nie używaj `gunicorn --preload` z BOT_MODE=auto: bot wystartowałby w procesie master
+# przed forkiem workerów (wątki i pętla asyncio nie przeżywają forka).
+
+BOT_MODE = os.environ.get('BOT_MODE', 'auto').lower()
+BOT_LOCK_FILE = os.environ.get('BOT_LOCK_FILE', '/tmp/discord-bot.lock')
+BOT_STATE_FILE = os.environ.get('BOT_STATE_FILE', '/tmp/discord-bot-state.json')
+METRICS_FILE = os.environ.get('METRICS_FILE', '/tmp/discord-bot-metrics.prom') # Zrzut metryk lidera dla pozostałych workerów
+BOT_LOCK_RETRY_SECONDS = 10 # Co tyle worker bez bota próbuje przejąć blokadę
+BOT_STATE_INTERVAL_SECONDS = 15 # Co tyle lider zapisuje stan bota
+BOT_STATE_STALE_SECONDS = 90 # Starszy stan oznacza, że lider nie żyje lub pętla stoi
+BOT_STARTUP_GRACE_SECONDS = 180
+BOT_RESTART_DELAY_SECONDS = 15 # Pierwsza przerwa przed ponownym bot.start() po awarii (potem x2)
+BOT_RESTART_MAX_DELAY_SECONDS = 600
+BOT_RESTART_RESET_SECONDS = 600 # Bot działający dłużej niż tyle zaczyna odliczanie przerw od nowa
+PROCESS_STARTED_AT = time.time()
+
+_bot_lock_handle = None # Otwarty plik blokady (trzymany przez cały czas życia lidera)
+_bot_hosted_here = False
+_bot_connecting_since = 0.0 # Początek bieżącej (lub zaplanowanej) próby bot.start(); wyznacza okres karencji /healthz
+_bot_fatal_error = None # Błąd, po którym ponowny start nie ma sensu (np. zły token)
+
+def try_acquire_bot_lock():
+    """Próbuje (bez czekania) zdobyć blokadę bota dla tego procesu."""
+    global _bot_lock_handle
+    if _bot_lock_handle is not None:
+        return True
+    handle = open(BOT_LOCK_FILE, 'a+')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return False
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    _bot_lock_handle = handle
+    return True
+
+def release_bot_lock():
+    """Zwalnia blokadę (zamknięcie pliku zdejmuje flock), aby bota mógł przejąć inny worker."""
+    global _bot_lock_handle
+    if _bot_lock_handle is None:
+        return
+    try:
+        _bot_lock_handle.close()
+    finally:
+        _bot_lock_handle = None
+
+def _collect_bot_state():
+    latency = bot.latency
+    return {
+        "pid": os.getpid(),
+        "ready": bot.is_ready(),
+        "closed": bot.is_closed(),
+        "user": str(bot.user) if bot.user else None,
+        "guilds": len(bot.guilds),
+        "latency_ms": round(latency * 1000, 1) if latency == latency and latency != float('inf') else None,
+        "started_at": PROCESS_STARTED_AT,
+        "connecting_since": _bot_connecting_since,
+        "fatal": _bot_fatal_error,
+        "heartbeat": time.time(),
+        "loop_lag_ms": round(loop_watchdog.last_lag * 1000, 1),
+        "loop_stalls": loop_watchdog.worst_offenders(),
+        "open_circuits": http_client.circuit_states(),
+    }
+
+DISCORD_READY = metrics.REGISTRY.gauge('discord_ready', 'Czy bot jest połączony z Discordem (1/0).')
+DISCORD_LATENCY = metrics.REGISTRY.gauge('discord_gateway_latency_seconds', 'Opóźnienie heartbeatu bramki Discorda.')
+GEMINI_QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    'gemini_limiter_queue_depth', 'Liczba wywołań czekających na token limitera Gemini.', ['model'])
+
+def _update_runtime_gauges(state):
+    DISCORD_READY.set(1 if state['ready'] else 0)
+    if state['latency_ms'] is not None:
+        DISCORD_LATENCY.set(state['latency_ms'] / 1000)
+    for model, depth in gemini_rate_limiter.queue_depths().items():
+        GEMINI_QUEUE_DEPTH.set(depth, model=model)
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_metrics_snapshot():
+    try:
+        _write_atomic(METRICS_FILE, metrics.REGISTRY.render())
+    except Exception as e:
+        print(f"Błąd zapisu metryk: {e}")
+
+def get_metrics_text():
+    """Metryki procesu z botem: z pamięci u lidera, z ostatniego zrzutu w pozostałych workerach."""
+    if not _bot_hosted_here:
+        try:
+            with open(METRICS_FILE, 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+    return metrics.REGISTRY.render()
+
+def write_bot_state(state):
+    """Zapisuje stan bota atomowo, aby workery bez bota mogły go odczytać."""
+    try:
+        _write_atomic(BOT_STATE_FILE, json.dumps(state))
+    except Exception as e:
+        print(f"Błąd zapisu stanu bota: {e}")
+
+def get_bot_state():
+    """Stan bota: z pamięci, jeśli działa w tym procesie, w przeciwnym razie z pliku lidera."""
+    if _bot_hosted_here:
+        return _collect_bot_state()
+    try:
+        with open(BOT_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+async def _bot_state_heartbeat():
+    while True:
+        state = _collect_bot_state()
+        write_bot_state(state)
+        _update_runtime_gauges(state)
+        write_metrics_snapshot()
+        await asyncio.sleep(BOT_STATE_INTERVAL_SECONDS)
+
+def _bot_leader_election():
+    """Wątek workera: czeka na blokadę i - jako jedyny na hoście - uruchamia bota."""
+    while not try_acquire_bot_lock():
+        time.sleep(BOT_LOCK_RETRY_SECONDS)
+    print(f"[PID {os.getpid()}] Ten proces przejął blokadę i uruchamia bota Discord.")
+    try:
+        run_discord_bot_sync()
+    finally:
+        # Po błędzie krytycznym (zły token) trzymamy blokadę, aby kolejne workery
+        # nie próbowały logować się tym samym tokenem; w pozostałych przypadkach oddajemy ją
+        if _bot_fatal_error is None:
+            release_bot_lock()
+
+# --- KONIEC BLOKU: JEDEN BOT NA HOST (WYBÓR LIDERA) ---
+
 # --- Funkcja uruchamiająca Bota (w wątku) (POPRAWIONA) ---
 def run_discord_bot_sync():
     """Uruchamia bota w synchronicznej funkcji, zarządzając własną pętlą asyncio."""
@@ -229,115 +1165,382 @@ def run_discord_bot_sync():
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
+    global _bot_hosted_here, _bot_connecting_since, _bot_fatal_error
+    _bot_hosted_here = True
+    # Wątek bota jest daemonem i przy wyjściu workera nie dojdzie do bloku finally
+    atexit.register(WATCHER_GURU_SENT_URLS.flush)
+    heartbeat = loop.create_task(_bot_state_heartbeat())
+    loop_watchdog.start(loop)
+    restart_delay = BOT_RESTART_DELAY_SECONDS
     try:
-        # Używamy bot.start() zamiast bot.run()
-        loop.run_until_complete(bot.start(BOT_TOKEN))
-    except Exception as e:
-        print(f"Krytyczny błąd podczas uruchamiania bota Discord: {e}")
+        while True:
+            started = time.monotonic()
+            _bot_connecting_since = time.time()
+            try:
+                # Używamy bot.start() zamiast bot.run()
+                loop.run_until_complete(bot.start(BOT_TOKEN))
+                print("Bot Discord zakończył połączenie.")
+            except discord.LoginFailure as e:
+                # Zły token - ponawianie nic nie da
+                print(f"Krytyczny błąd logowania bota Discord: {e}")
+                _bot_fatal_error = f"błąd logowania: {e}"
+                break
+            except Exception as e:
+                print(f"Krytyczny błąd podczas uruchamiania bota Discord: {e}")
+
+            # Ponowny start w tej samej pętli (blokady i kolejki asyncio są z nią związane)
+            if time.monotonic() - started > BOT_RESTART_RESET_SECONDS:
+                restart_delay = BOT_RESTART_DELAY_SECONDS
+            print(f"Ponowne uruchomienie bota Discord za {restart_delay} s.")
+            # Karencja /healthz liczy się od zaplanowanego startu, więc obejmuje całą przerwę
+            _bot_connecting_since = time.time() + restart_delay
+            loop.run_until_complete(bot.close())
+            bot.clear()
+            loop.run_until_complete(asyncio.sleep(restart_delay)) # Heartbeat działa dalej i zgłasza ready=False
+            restart_delay = min(restart_delay * 2, BOT_RESTART_MAX_DELAY_SECONDS)
     finally:
+        heartbeat.cancel()
+        loop_watchdog.stop()
+        for bulkhead in BULKHEADS:
+            bulkhead.shutdown()
+        WATCHER_GURU_SENT_URLS.flush()
         loop.run_until_complete(bot.close())
+        loop.run_until_complete(http_client.close())
         loop.close()
+        write_bot_state({**_collect_bot_state(), "ready": False})
 
 # --- FUNKCJE POMOCNICZE, KOMENDY, TASKI ---
 
+# --- POCZĄTEK BLOKU: LOKALNY WYKRES FEAR & GREED ---
+# Indeks zmienia się raz na dobę: pobieramy go (z historią) najwyżej raz na okres
+# aktualizacji podany przez API, wykres rysujemy sami, a PNG trzymamy w pamięci
+# per (wartość, dzień). Obraz idzie do Discorda jako załącznik, bez alternative.me.
+
+FEAR_GREED_HISTORY_DAYS = 30
+FEAR_GREED_FILENAME = "fear_greed.png"
+FEAR_GREED_ATTACHMENT_URL = f"attachment://{FEAR_GREED_FILENAME}"
+FEAR_GREED_MIN_TTL_SECONDS = 60 # Gdy API poda 0 (aktualizacja "za chwilę"), nie odpytujemy go w pętli
+FEAR_GREED_PNG_CACHE_SIZE = 8
+FEAR_GREED_ZONES = [ # (górna granica, kolor)
+    (25, (234, 57, 67)), (45, (244, 140, 60)), (55, (245, 204, 65)), (75, (147, 200, 80)), (100, (22, 199, 132)),
+]
+
+FearGreedIndex = namedtuple("FearGreedIndex", ["value", "classification", "day", "history", "time_until_update"])
+
+def _fear_greed_ttl(index):
+    return max(index.time_until_update, FEAR_GREED_MIN_TTL_SECONDS)
+
+async def _fetch_fear_greed_index():
+    payload = await http_client.get_json(FEAR_GREED_API_URL, params={'limit': FEAR_GREED_HISTORY_DAYS})
+    data = payload['data'] # Od najnowszego do najstarszego
+    latest = data[0]
+    return FearGreedIndex(
+        value=int(latest['value']),
+        classification=latest['value_classification'],
+        day=datetime.datetime.fromtimestamp(int(latest['timestamp']), TZ_POLAND).date(),
+        history=[int(item['value']) for item in reversed(data)],
+        time_until_update=int(latest.get('time_until_update') or 0),
+    )
+
+fear_greed_cache = AsyncTtlCache(ttl=FEAR_GREED_MIN_TTL_SECONDS, max_entries=1, name='fear_greed', ttl_for=_fear_greed_ttl)
+_fear_greed_png_cache = OrderedDict() # (wartość, dzień) -> bajty PNG
+
+async def get_fear_greed_index():
+    """Zwraca (FearGreedIndex, stan_na) - wspólne dla /fg, raportów i snapshotu AI."""
+    return await fear_greed_cache.get_with_fallback('fng', _fetch_fear_greed_index)
+
+def _fear_greed_color(value):
+    return next(color for limit, color in FEAR_GREED_ZONES if value <= limit)
+
+def render_fear_greed_gauge(index):
+    """Rysuje wskaźnik (półokrąg ze wskazówką) i trend z ostatnich dni; zwraca bajty PNG."""
+    width, height = 640, 420
+    image = Image.new('RGB', (width, height), (24, 26, 31))
+    draw = ImageDraw.Draw(image)
+    title_font, value_font, label_font, small_font = (ImageFont.load_default(size=size) for size in (26, 64, 28, 16))
+
+    draw.text((width // 2, 28), f"Fear & Greed Index  {index.day:%Y-%m-%d}", font=title_font, anchor='mm', fill=(220, 220, 220))
+    cx, cy, radius = width // 2, 250, 180
+    start = 0
+    for limit, color in FEAR_GREED_ZONES:
+        # Kąty Pillow rosną zgodnie z ruchem wskazówek zegara od godziny 3: 180 = lewo, 360 = prawo
+        draw.arc((cx - radius, cy - radius, cx + radius, cy + radius), 180 + start * 1.8, 180 + limit * 1.8, fill=color, width=30)
+        start = limit
+    angle = math.radians(180 + index.value * 1.8)
+    tip = (cx + (radius - 45) * math.cos(angle), cy + (radius - 45) * math.sin(angle))
+    draw.line([(cx, cy), tip], fill=(235, 235, 235), width=6)
+    draw.ellipse((cx - 10, cy - 10, cx + 10, cy + 10), fill=(235, 235, 235))
+    draw.text((cx, cy - 75), str(index.value), font=value_font, anchor='mm', fill=_fear_greed_color(index.value))
+    draw.text((cx, cy + 32), index.classification, font=label_font, anchor='mm', fill=(220, 220, 220))
+
+    # Trend: linia wartości z ostatnich dni pod wskaźnikiem
+    if len(index.history) > 1:
+        left, right, top, bottom = 40, width - 40, 315, 395
+        step = (right - left) / (len(index.history) - 1)
+        points = [(left + i * step, bottom - value / 100 * (bottom - top)) for i, value in enumerate(index.history)]
+        draw.line([(left, (top + bottom) / 2), (right, (top + bottom) / 2)], fill=(60, 63, 70), width=1)
+        draw.line(points, fill=(120, 160, 230), width=3)
+        draw.text((left, top - 12), f"{len(index.history)} dni", font=small_font, anchor='lm', fill=(150, 150, 150))
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+async def get_fear_greed_png():
+    """PNG wskaźnika (z pamięci dla tej samej wartości i dnia); None, jeśli indeksu nie da się pobrać."""
+    try:
+        index, _ = await get_fear_greed_index()
+    except Exception as e:
+        print(f"Blad pobierania indeksu Fear & Greed: {e}")
+        return None
+    key = (index.value, index.day)
+    png = _fear_greed_png_cache.get(key)
+    if png is None:
+        png = await MARKET_DATA_BULKHEAD.run(render_fear_greed_gauge, index)
+        _fear_greed_png_cache[key] = png
+        while len(_fear_greed_png_cache) > FEAR_GREED_PNG_CACHE_SIZE:
+            _fear_greed_png_cache.popitem(last=False)
+    return png
+
+def fear_greed_file(png):
+    """Nowy discord.File dla każdej wiadomości (strumień jest zużywany przy wysyłce)."""
+    return discord.File(io.BytesIO(png), filename=FEAR_GREED_FILENAME)
+
 def get_fear_and_greed_image():
-    timestamp = int(time.time())
-    return f"https://alternative.me/crypto/fear-and-greed-index.png?v={timestamp}"
+    """Zapasowy adres obrazka alternative.me (zmienia się raz dziennie, więc cache Discorda działa)."""
+    return f"https://alternative.me/crypto/fear-and-greed-index.png?v={date.today().isoformat()}"
+
+# --- KONIEC BLOKU: LOKALNY WYKRES FEAR & GREED ---
 
 def calculate_rsi(prices, period=14):
+    """Ostatnia wartość RSI Wildera (wektorowo, przez moduł indicators)."""
     if len(prices) < period + 1:
         return 50.0 
-    
-    deltas = np.diff(prices)
-    gains = deltas[deltas > 0]
-    losses = -deltas[deltas < 0]
-    
-    avg_gain = np.mean(gains[:period]) if gains.size > 0 else 0
-    avg_loss = np.mean(losses[:period]) if losses.size > 0 else 0
+    return float(indicators.rsi(prices, period)[-1])
 
-    if avg_loss == 0:
-        return 100.0 if avg_gain > 0 else 50.0
-
-    rs = avg_gain / avg_loss
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-
-    for i in range(period, len(deltas)):
-        delta = deltas[i]
-        gain = delta if delta > 0 else 0
-        loss = -delta if delta < 0 else 0
-        
-        avg_gain = (avg_gain * (period - 1) + gain) / period
-        avg_loss = (avg_loss * (period - 1) + loss) / period
-        
-        if avg_loss == 0:
-            rs = float('inf')
-        else:
-            rs = avg_gain / avg_loss
-        
-        rsi = 100.0 - (100.0 / (1.0 + rs))
-        
-    return rsi
+class ReportSectionError(Exception):
+    """Sekcja raportu nie powiodła się; treść wyjątku to komunikat dla użytkownika."""
 
-def get_top_gainers(count=10):
+async def get_top_gainers(count=10, raise_errors=False):
     if not COINGECKO_API_KEY: return "Brak klucza API CoinGecko."
-    headers = {'x-cg-demo-api-key': COINGECKO_API_KEY.strip()}
     stablecoin_symbols = {'usdt', 'usdc', 'dai', 'busd', 'ust', 'tusd'}
 
     try:
+        # Te same parametry dla każdego `count`, więc raport i /gainers dzielą jeden wpis w pamięci
         params = {'vs_currency': 'usd', 'order': 'market_cap_desc', 'per_page': 100, 'page': 1}
-        response = requests.get("https://api.coingecko.com/api/v3/coins/markets", params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data, stale_as_of = await fetch_coins_markets(params)
         filtered_data = [coin for coin in data if coin['symbol'] not in stablecoin_symbols]
         sorted_gainers = sorted(filtered_data, key=lambda x: x.get('price_change_percentage_24h', 0) or 0, reverse=True)
         gainers_list = [f"🥇 **{c['name']} ({c['symbol'].upper()})**: `+{c.get('price_change_percentage_24h', 0):.2f}%`" for c in sorted_gainers[:count]]
-        return "\n".join(gainers_list) if gainers_list else "Brak danych lub wszystkie monety odnotowaly spadek."
+        if not gainers_list: return "Brak danych lub wszystkie monety odnotowaly spadek."
+        return "\n".join(gainers_list) + stale_marker(stale_as_of)
     except Exception as e:
         print(f"Blad polaczenia lub przetwarzania CoinGecko: {e}")
-        return "Blad: Problem z pobraniem danych."
+        message = "Blad: Problem z pobraniem danych."
+        if raise_errors: raise ReportSectionError(message) from e
+        return message
+
+# --- POCZĄTEK BLOKU: KALENDARZ EKONOMICZNY ---
+
+ECONOMIC_CALENDAR_TTL_SECONDS = 24 * 3600 # Kalendarz zmienia się najwyżej raz dziennie
+ECONOMIC_CALENDAR_STALE_SECONDS = 24 * 3600 # Przez kolejną dobę serwujemy stary, odświeżając w tle
+FED_EVENTS_WINDOW_DAYS = 14
+FED_EVENT_PATTERN = re.compile(r"FOMC|Fed|Interest Rate|Inflation Rate", re.IGNORECASE)
+
+class EconomicCalendar:
+    """
+    Wydarzenia FED z kalendarza AlphaVantage, posortowane po dacie.
+    Zapytanie o okno "najbliższe N dni" to dwa wyszukiwania binarne.
+    """
+
+    def __init__(self, events):
+        self._events = sorted(events) # lista (data, nazwa), bez powtórzeń
+        self._dates = [event_date for event_date, _ in self._events]
+
+    def __len__(self):
+        return len(self._events)
+
+    def window(self, start, days):
+        """Wydarzenia z przedziału [start, start + days] (włącznie)."""
+        lo = bisect.bisect_left(self._dates, start)
+        hi = bisect.bisect_right(self._dates, start + timedelta(days=days))
+        return self._events[lo:hi]
+
+async def _fetch_economic_calendar():
+    """Pobiera CSV strumieniowo i od razu filtruje wiersze (nazwa -> regex, dopiero potem data)."""
+    params = {'function': 'ECONOMIC_CALENDAR', 'horizon': '3month', 'apikey': ALPHAVANTAGE_API_KEY.strip()}
+    lines = http_client.iter_lines(ALPHAVANTAGE_API_URL, params=params)
+    header = None
+    events = set()
+    async for line in lines:
+        if not line: continue
+        row = next(csv.reader([line]))
+        if header is None:
+            header = {name: i for i, name in enumerate(row)}
+            if 'releaseDate' not in header or 'event' not in header:
+                # AlphaVantage przy limicie zwraca JSON z komunikatem zamiast CSV - nie zapisujemy tego w pamięci
+                raise ValueError(f"Nieoczekiwana odpowiedź AlphaVantage: {line[:200]}")
+            date_col, event_col = header['releaseDate'], header['event']
+            continue
+        if len(row) <= max(date_col, event_col): continue
+        event_name = row[event_col]
+        if not FED_EVENT_PATTERN.search(event_name): continue
+        try:
+            events.add((date.fromisoformat(row[date_col]), event_name))
+        except ValueError:
+            continue
+    if header is None:
+        raise ValueError("Pusta odpowiedź AlphaVantage.")
+    return EconomicCalendar(events)
+
+economic_calendar_cache = AsyncTtlCache(ttl=ECONOMIC_CALENDAR_TTL_SECONDS, stale_ttl=ECONOMIC_CALENDAR_STALE_SECONDS, max_entries=1,
+                                        name='economic_calendar')
 
-def get_fed_events():
+async def get_fed_events(raise_errors=False):
     if not ALPHAVANTAGE_API_KEY: return "Brak klucza API AlphaVantage."
     try:
-        url = f'https://www.alphavantage.co/query?function=ECONOMIC_CALENDAR&horizon=3month&apikey={ALPHAVANTAGE_API_KEY.strip()}'
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        csv_file = io.StringIO(response.text)
-        reader = csv.DictReader(csv_file)
-        today = date.today()
-        next_14_days = today + timedelta(days=14)
-        fed_events = []
-        keywords = ["FOMC", "Fed", "Interest Rate", "Inflation Rate"]
-        for row in reader:
-            event_date_str = row.get('releaseDate')
-            if not event_date_str: continue
-            event_date = datetime.datetime.strptime(event_date_str, '%Y-%m-%d').date()
-            if today <= event_date <= next_14_days:
-                event_name = row.get('event', '')
-                if any(k.lower() in event_name.lower() for k in keywords):
-                    event_str = f"🗓️ **{event_date.strftime('%Y-%m-%d')}**: `{event_name}`"
-                    if event_str not in fed_events:
-                        fed_events.append(event_str)
-        return "\n".join(fed_events) if fed_events else "Brak kluczowych wydarzeń FED w najblizszych 2 tygodniach."
+        calendar, stale_as_of = await economic_calendar_cache.get_with_fallback('calendar', _fetch_economic_calendar)
+        fed_events = [
+            f"🗓️ **{event_date.strftime('%Y-%m-%d')}**: `{event_name}`"
+            for event_date, event_name in calendar.window(date.today(), FED_EVENTS_WINDOW_DAYS)
+        ]
+        if not fed_events: return "Brak kluczowych wydarzeń FED w najblizszych 2 tygodniach." + stale_marker(stale_as_of)
+        return "\n".join(fed_events) + stale_marker(stale_as_of)
     except Exception as e:
-        return f"Blad podczas pobierania wydarzeń FED: {e}"
+        message = f"Blad podczas pobierania wydarzeń FED: {e}"
+        if raise_errors: raise ReportSectionError(message) from e
+        return message
+
+# --- KONIEC BLOKU: KALENDARZ EKONOMICZNY ---
+
+# --- POCZĄTEK BLOKU: LOKALNA HISTORIA CEN ---
+
+PRICE_HISTORY_DIR = "price_history" # Katalog z plikami .npy (jeden na monetę)
+PRICE_HISTORY_MAX_DAYS = 90 # Tyle historii trzymamy; do 90 dni CoinGecko podaje dane godzinowe
+PRICE_HISTORY_REFRESH_SECONDS = 300 # Młodszy ostatni punkt = analiza wyłącznie z dysku
+PRICE_HISTORY_STEP_MS = 3600 * 1000 # Docelowy odstęp punktów (1h)
+ANALYSIS_LOOKBACK_DAYS = 15 # Okno danych dla /analiza
+SUPPORT_RESISTANCE_DAYS = 7 # Okno wsparcia/oporu - to samo co sparkline 7D w analizie wielu monet
+
+class PriceHistoryStore:
+    """
+    Lokalny magazyn historii cen. Dla każdej monety jeden plik .npy z macierzą
+    2 x N (wiersz 0: znaczniki czasu w ms, wiersz 1: ceny), czytany przez mmap:
+    do pamięci kopiujemy tylko potrzebne okno (albo całość, gdy dopisujemy ogon).
+    Z CoinGecko dociągamy tylko brakujący ogon od ostatniego zapisanego punktu.
+    """
+
+    def __init__(self, directory, max_days):
+        self.directory = directory
+        self.max_days = max_days
+        self._locks = {}
+
+    def _path(self, coin_id):
+        return os.path.join(self.directory, re.sub(r"[^a-z0-9._-]", "_", coin_id.lower()) + ".npy")
+
+    def _lock(self, coin_id):
+        lock = self._locks.get(coin_id)
+        if lock is None:
+            lock = self._locks[coin_id] = asyncio.Lock()
+        return lock
+
+    def _load(self, coin_id):
+        """Zwraca macierz zmapowaną z pliku (tylko do odczytu); _save podmienia plik przez os.replace, więc mapa pozostaje spójna."""
+        try:
+            return np.load(self._path(coin_id), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+    def _save(self, coin_id, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(coin_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(data))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _merge(stored, fresh):
+        """
+        Dokleja nowe punkty, zachowując siatkę ~1h. Ostatni zapisany punkt to
+        zwykle "cena na teraz", więc zastępujemy go świeższymi danymi.
+        """
+        confirmed = stored[:, :-1]
+        last_ts = confirmed[0, -1] if confirmed.shape[1] else -np.inf
+        fresh = fresh[:, fresh[0] > last_ts]
+        if fresh.shape[1] == 0:
+            return stored
+        keep = []
+        previous = last_ts
+        for i, ts in enumerate(fresh[0]):
+            # Krótki zakres z CoinGecko ma punkty co 5 min - przerzedzamy je do 1h
+            if ts - previous >= PRICE_HISTORY_STEP_MS * 0.9 or i == fresh.shape[1] - 1:
+                keep.append(i)
+                previous = ts
+        return np.concatenate([confirmed, fresh[:, keep]], axis=1)
+
+    async def _fetch(self, coin_id, params, endpoint="market_chart"):
+        headers = {'x-cg-demo-api-key': COINGECKO_API_KEY.strip()}
+        chart_data = await http_client.get_json(f"{COINGECKO_API_URL}/coins/{coin_id}/{endpoint}", params=params, headers=headers)
+        points = np.asarray(chart_data.get('prices') or [], dtype=np.float64).reshape(-1, 2)
+        return points.T.copy()
+
+    async def get_prices(self, coin_id, days, interactive=False):
+        """Zwraca (znaczniki czasu w ms, ceny) z ostatnich `days` dni, pobierając tylko brakujący ogon."""
+        async with self._lock(coin_id):
+            data = await MARKET_DATA_BULKHEAD.run(self._load, coin_id, interactive=interactive)
+            now_ms = time.time() * 1000
+            max_age_ms = self.max_days * 86400 * 1000
+
+            has_history = data is not None and data.shape[1] >= 2
+            try:
+                if not has_history or now_ms - data[0, -1] > max_age_ms:
+                    # Brak historii (lub zbyt stara): jedno pełne zapytanie o cały horyzont
+                    data = await self._fetch(coin_id, {'vs_currency': 'usd', 'days': self.max_days})
+                    changed = True
+                elif now_ms - data[0, -1] > PRICE_HISTORY_REFRESH_SECONDS * 1000:
+                    # Tylko ogon od przedostatniego punktu (ostatni to "cena na teraz")
+                    tail = await self._fetch(coin_id, {
+                        'vs_currency': 'usd',
+                        'from': int(data[0, -2] // 1000),
+                        'to': int(now_ms // 1000),
+                    }, endpoint="market_chart/range")
+                    data = self._merge(data, tail)
+                    changed = True
+                else:
+                    changed = False
+            except Exception as e:
+                if not has_history or not is_transient_upstream_error(e):
+                    raise
+                # CoinGecko niedostępne: podajemy historię z dysku (okno liczone od jej ostatniego punktu)
+                print(f"CoinGecko niedostępne dla {coin_id} ({e}), używam historii z dysku.")
+                now_ms = min(now_ms, data[0, -1])
+                changed = False
+
+            if changed and data.shape[1]:
+                data = data[:, data[0] >= data[0, -1] - max_age_ms]
+                await MARKET_DATA_BULKHEAD.run(self._save, coin_id, data)
+
+        # Znaczniki czasu są rosnące: wyszukiwanie binarne i kopia samego okna (z mmap czytamy tylko je)
+        start = np.searchsorted(data[0], now_ms - days * 86400 * 1000, side='left')
+        window = np.array(data[:, start:])
+        return window[0], window[1]
+
+price_history_store = PriceHistoryStore(PRICE_HISTORY_DIR, PRICE_HISTORY_MAX_DAYS)
+
+# --- KONIEC BLOKU: LOKALNA HISTORIA CEN ---
 
 # --- NOWA FUNKCJA ANALIZY DLA POJEDYNCZEJ KRYPTO ---
-def get_single_coin_analysis(coin_id: str):
-    """Pobiera i analizuje dane dla JEDNEJ krypto (synchronicznie)"""
+async def get_single_coin_analysis(coin_id: str, interactive=False):
+    """Pobiera i analizuje dane dla JEDNEJ krypto (asynchronicznie)"""
     if not COINGECKO_API_KEY: 
         return "Brak klucza API CoinGecko.", None
     
     try:
-        headers = {'x-cg-demo-api-key': COINGECKO_API_KEY.strip()}
-        
-        # Pobieramy dane z ostatnich 15 dni do obliczeń
-        chart_url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart?vs_currency=usd&days=15"
-        response_chart = requests.get(chart_url, headers=headers, timeout=10)
-        response_chart.raise_for_status() # Zwróci błąd 404 jeśli ID jest złe
+        # Dane z ostatnich 15 dni: z lokalnego magazynu, z CoinGecko tylko brakujący ogon
+        timestamps, prices = await price_history_store.get_prices(coin_id, days=ANALYSIS_LOOKBACK_DAYS, interactive=interactive) # Zwróci błąd 404 jeśli ID jest złe
         
-        prices = [p[1] for p in response_chart.json()['prices']]
-        if not prices:
+        if not len(prices):
              return f"Brak danych o cenach dla `{coin_id}`.", None
 
         # Obliczenia
@@ -346,21 +1549,27 @@ def get_single_coin_analysis(coin_id: str):
         if rsi > 70: rsi_interpretation = "Rynek wykupiony 📈"
         if rsi < 30: rsi_interpretation = "Rynek wyprzedany 📉"
         
-        prices_7_days = prices[-7:] # Bierzemy ostatnie 7 dni z 15
-        support = min(prices_7_days)
-        resistance = max(prices_7_days)
-        current_price = prices[-1]
+        # Ostatnie 7 dni z 15 (dane godzinowe, więc okno wyznaczają znaczniki czasu, nie liczba punktów)
+        prices_7_days = prices[timestamps >= timestamps[-1] - SUPPORT_RESISTANCE_DAYS * 86400 * 1000]
+        support = float(np.min(prices_7_days))
+        resistance = float(np.max(prices_7_days))
+        current_price = float(prices[-1])
         
         analysis_text = (
             f"- **RSI (14D):** `{rsi:.2f}` ({rsi_interpretation})\n"
             f"- **Wsparcie (7D):** `${support:,.2f}`\n"
             f"- **Opór (7D):** `${resistance:,.2f}`"
         )
+        if time.time() * 1000 - timestamps[-1] > 2 * PRICE_HISTORY_REFRESH_SECONDS * 1000:
+            # Historia z dysku, bo CoinGecko nie odpowiada
+            analysis_text += stale_marker(datetime.datetime.fromtimestamp(timestamps[-1] / 1000, TZ_POLAND))
         
         return analysis_text, current_price # Zwracamy tekst i aktualną cenę
         
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
+    except BulkheadFullError:
+        return "Bot obsługuje teraz zbyt wiele analiz. Spróbuj ponownie za chwilę.", None
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
             return f"Nie znaleziono kryptowaluty o ID: `{coin_id}`. Użyj pełnego ID (np. 'bitcoin', 'ethereum', 'solana').", None
         else:
             return f"Błąd API CoinGecko: {e}", None
@@ -370,173 +1579,1006 @@ def get_single_coin_analysis(coin_id: str):
 # --- KONIEC NOWEJ FUNKCJI ---
 
 
+# --- POCZĄTEK BLOKU: ANALIZA WIELU MONET ---
+
+MULTI_ANALYSIS_MAX_COINS = 10 # Tyle monet mieści się czytelnie w jednym embedzie
+
+def parse_coin_ids(text):
+    """Dzieli wpis użytkownika na listę ID (przecinki/spacje), bez powtórzeń, z zachowaniem kolejności."""
+    coin_ids = []
+    for part in re.split(r"[,;\s]+", text.lower()):
+        if part and part not in coin_ids:
+            coin_ids.append(part)
+    return coin_ids
+
+def _forward_fill(matrix):
+    """Uzupełnia luki (NaN) w każdym wierszu ostatnią znaną wartością."""
+    mask = np.isnan(matrix)
+    if not mask.any():
+        return matrix
+    index = np.where(~mask, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return matrix[np.arange(matrix.shape[0])[:, np.newaxis], index]
+
+async def get_multi_coin_analysis(coin_ids):
+    """
+    Analiza kilku monet naraz: jedno zapytanie /coins/markets ze sparkline (7 dni)
+    i obliczenia RSI oraz wsparcia/oporu (7D) na macierzy monety x czas.
+    Zwraca (wiersze posortowane malejąco po RSI, lista nieznalezionych ID, stan_na).
+    """
+    params = {'vs_currency': 'usd', 'ids': ','.join(sorted(coin_ids)), 'sparkline': 'true',
+              'per_page': len(coin_ids), 'page': 1}
+    data, stale_as_of = await fetch_coins_markets(params)
+    coins_by_id = {c['id']: c for c in data}
+
+    found, series = [], []
+    for coin_id in coin_ids:
+        coin = coins_by_id.get(coin_id)
+        sparkline = ((coin or {}).get('sparkline_in_7d') or {}).get('price') or []
+        if sum(p is not None for p in sparkline) > 15:
+            found.append(coin)
+            series.append([np.nan if p is None else p for p in sparkline])
+    missing = [coin_id for coin_id in coin_ids if coin_id not in {c['id'] for c in found}]
+    if not found:
+        return [], missing, stale_as_of
+
+    # Wyrównujemy szeregi do prawej (najnowsze punkty); krótsza historia = NaN na początku wiersza
+    length = max(len(s) for s in series)
+    matrix = _forward_fill(np.array([[np.nan] * (length - len(s)) + s for s in series], dtype=np.float64))
+    complete = ~np.isnan(matrix).any(axis=1)
+    rsi_values = np.full(len(found), np.nan)
+    if complete.any():
+        rsi_values[complete] = indicators.rsi(matrix[complete])[:, -1] # Pełne wiersze macierzowo
+    for i in np.flatnonzero(~complete):
+        # Wiersz z lukami na początku: RSI z samej znanej części (NaN, gdy okno RSI jest niepełne)
+        known = matrix[i, np.argmax(~np.isnan(matrix[i])):]
+        rsi_values[i] = indicators.rsi(known)[-1]
+    supports = np.nanmin(matrix, axis=1)
+    resistances = np.nanmax(matrix, axis=1)
+
+    rows = []
+    for i in np.argsort(-np.nan_to_num(rsi_values, nan=50.0), kind='stable'):
+        coin = found[i]
+        rows.append({
+            'id': coin['id'], 'name': coin['name'], 'symbol': coin['symbol'].upper(),
+            'price': float(coin.get('current_price') or matrix[i, -1]),
+            'rsi': None if np.isnan(rsi_values[i]) else float(rsi_values[i]), 'support': float(supports[i]), 'resistance': float(resistances[i]),
+        })
+    return rows, missing, stale_as_of
+
+async def get_multi_coin_analysis_embed(coin_ids):
+    """Buduje jeden embed z rankingiem monet wg RSI."""
+    if not COINGECKO_API_KEY:
+        return discord.Embed(title="Błąd Analizy", description="Brak klucza API CoinGecko.", color=discord.Color.red())
+    coin_ids = coin_ids[:MULTI_ANALYSIS_MAX_COINS]
+    try:
+        rows, missing, stale_as_of = await get_multi_coin_analysis(coin_ids)
+    except Exception as e:
+        print(f"Blad analizy wsadowej dla {coin_ids}: {e}")
+        return discord.Embed(title="Błąd Analizy", description=f"Błąd analizy dla {', '.join(coin_ids)}.", color=discord.Color.red())
+
+    if not rows:
+        return discord.Embed(
+            title="Błąd Analizy",
+            description=f"Nie znaleziono kryptowalut o ID: `{', '.join(missing)}`. Użyj pełnego ID (np. 'bitcoin', 'ethereum', 'solana').",
+            color=discord.Color.red()
+        )
+
+    lines = []
+    for position, row in enumerate(rows, start=1):
+        if row['rsi'] is None:
+            rsi_text = "`brak danych`" # Za krótka historia na okno RSI
+        else:
+            rsi_interpretation = "😐"
+            if row['rsi'] > 70: rsi_interpretation = "📈"
+            if row['rsi'] < 30: rsi_interpretation = "📉"
+            rsi_text = f"`{row['rsi']:.2f}` {rsi_interpretation}"
+        lines.append(
+            f"**{position}. {row['name']} ({row['symbol']})** `${row['price']:,.2f}`\n"
+            f"RSI (14): {rsi_text} | Wsparcie (7D): `${row['support']:,.2f}` | Opór (7D): `${row['resistance']:,.2f}`"
+        )
+    embed = discord.Embed(title="📊 Analiza porównawcza (ranking wg RSI)", description="\n\n".join(lines) + stale_marker(stale_as_of), color=discord.Color.orange())
+    if missing:
+        embed.set_footer(text=f"Nie znaleziono: {', '.join(missing)}")
+    return embed
+
+# --- KONIEC BLOKU: ANALIZA WIELU MONET ---
+
+
+# --- POCZĄTEK BLOKU: LOKALNY INDEKS MONET (AUTOUZUPEŁNIANIE) ---
+
+COIN_INDEX_FILE = "coins_index.json" # Lista monet CoinGecko zapisana lokalnie
+COIN_INDEX_RANKED_COINS = 250 # Tyle monet z rankingiem kapitalizacji ma pierwszeństwo w podpowiedziach
+COIN_INDEX_SUGGESTIONS = 25 # Limit podpowiedzi Discorda
+COIN_INDEX_PRECOMPUTED_PREFIX = 2 # Dla tak krótkich prefiksów podpowiedzi są liczone z góry
+
+# Niezmienny stan indeksu; podmieniany jednym przypisaniem w pętli zdarzeń
+CoinIndexSnapshot = namedtuple("CoinIndexSnapshot", ["coins", "ranks", "exact", "keys", "key_ids", "short_prefixes"])
+
+def _coin_sort_key(ranks):
+    return lambda coin_id: (ranks.get(coin_id, float('inf')), len(coin_id), coin_id)
+
+class CoinIndex:
+    """
+    Lokalny indeks monet CoinGecko (ID, symbole, nazwy) do podpowiedzi
+    i zamiany symboli na ID bez zapytań do sieci. Klucze trzymamy
+    w posortowanej tablicy, więc wyszukanie prefiksu to dwa bisecty;
+    najkrótsze prefiksy mają gotowe listy podpowiedzi.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = CoinIndexSnapshot({}, {}, {}, [], [], {})
+        self._loaded = False
+
+    @property
+    def coins(self):
+        return self._snapshot.coins # id -> (symbol, nazwa)
+
+    @property
+    def ready(self):
+        return bool(self._snapshot.coins)
+
+    @staticmethod
+    def _build(coins, ranks):
+        """Buduje nowy snapshot od zera (w wątku); niczego nie przypisuje do indeksu."""
+        by_id = {c[0]: (c[1], c[2]) for c in coins}
+        exact = {}
+        for coin_id, (symbol, name) in by_id.items():
+            for key in {coin_id, symbol.lower(), name.lower()}:
+                exact.setdefault(key, []).append(coin_id)
+        order = _coin_sort_key(ranks)
+        for ids in exact.values():
+            ids.sort(key=order)
+
+        keys = sorted(exact)
+        short_prefixes = {}
+        for key in keys:
+            for length in range(1, COIN_INDEX_PRECOMPUTED_PREFIX + 1):
+                if len(key) >= length:
+                    short_prefixes.setdefault(key[:length], set()).update(exact[key])
+        short_prefixes = {p: sorted(ids, key=order)[:COIN_INDEX_SUGGESTIONS] for p, ids in short_prefixes.items()}
+        return CoinIndexSnapshot(by_id, ranks, exact, keys, [exact[k] for k in keys], short_prefixes)
+
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return self._build(data['coins'], data.get('ranks', {}))
+
+    async def load(self):
+        """Wczytuje indeks z dysku raz na proces (parsowanie i budowa poza pętlą zdarzeń)."""
+        if self._loaded: return
+        self._loaded = True
+        try:
+            snapshot = await MARKET_DATA_BULKHEAD.run(self._read)
+            if not self.ready: # Odświeżenie z sieci mogło nas wyprzedzić
+                self._snapshot = snapshot
+            print(f"Załadowano indeks {len(snapshot.coins)} monet z pliku {self.path}.")
+        except FileNotFoundError:
+            print(f"Plik {self.path} nie znaleziony, indeks monet zostanie pobrany.")
+        except Exception as e:
+            print(f"Błąd ładowania indeksu monet: {e}")
+
+    def _save(self, coins, ranks):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'coins': coins, 'ranks': ranks}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    async def refresh(self):
+        """Pobiera listę monet i ranking top 250, przebudowuje indeks i zapisuje go na dysk."""
+        headers = {'x-cg-demo-api-key': COINGECKO_API_KEY.strip()}
+        coin_list = await http_client.get_json(f"{COINGECKO_API_URL}/coins/list", headers=headers)
+        markets, _ = await fetch_coins_markets({'vs_currency': 'usd', 'order': 'market_cap_desc', 'per_page': COIN_INDEX_RANKED_COINS, 'page': 1})
+        coins = [[c['id'], c.get('symbol') or '', c.get('name') or ''] for c in coin_list if c.get('id')]
+        ranks = {c['id']: position for position, c in enumerate(markets)}
+        self._snapshot = await MARKET_DATA_BULKHEAD.run(self._build, coins, ranks)
+        await MARKET_DATA_BULKHEAD.run(self._save, coins, ranks)
+        print(f"Odświeżono indeks monet: {len(self.coins)} pozycji.")
+
+    def resolve(self, text):
+        """Zamienia ID, symbol lub nazwę na ID CoinGecko; None, jeśli nie ma takiej monety."""
+        snapshot = self._snapshot
+        key = text.lower().strip()
+        if key in snapshot.coins:
+            return key
+        ids = snapshot.exact.get(key)
+        return ids[0] if ids else None
+
+    def suggest(self, prefix, limit=COIN_INDEX_SUGGESTIONS):
+        """Zwraca do `limit` ID pasujących do prefiksu (ID, symbolu lub nazwy), najlepsze pierwsze."""
+        snapshot = self._snapshot
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        if len(prefix) <= COIN_INDEX_PRECOMPUTED_PREFIX:
+            return snapshot.short_prefixes.get(prefix, [])[:limit]
+        start = bisect.bisect_left(snapshot.keys, prefix)
+        stop = bisect.bisect_left(snapshot.keys, prefix + "\uffff")
+        candidates = set()
+        for ids in snapshot.key_ids[start:stop]:
+            candidates.update(ids)
+        return sorted(candidates, key=_coin_sort_key(snapshot.ranks))[:limit]
+
+coin_index = CoinIndex(COIN_INDEX_FILE)
+
+# --- KONIEC BLOKU: LOKALNY INDEKS MONET (AUTOUZUPEŁNIANIE) ---
+
+
+# --- POCZĄTEK BLOKU: LIMITER ZAPYTAŃ GEMINI ---
+
+# Priorytety (mniejsza liczba = obsługiwane wcześniej)
+GEMINI_PRIORITY_INTERACTIVE = 0 # Komendy użytkowników (/analiza_ai, /raport)
+GEMINI_PRIORITY_REPORT = 1 # Zaplanowane raporty
+GEMINI_PRIORITY_BACKGROUND = 2 # Tłumaczenia i cykliczne newsy
+
+# model -> (zapytania na minutę, maksymalna seria)
+GEMINI_RATE_LIMITS = {
+    'gemini-2.5-pro': (int(os.environ.get('GEMINI_PRO_RPM', 5)), 2),
+    'gemini-2.5-flash': (int(os.environ.get('GEMINI_FLASH_RPM', 10)), 3),
+}
+
+class GeminiRateLimiter:
+    """
+    Wspólny dla całego procesu limiter zapytań do Gemini.
+    Każdy model ma własny token-bucket, a czekający są obsługiwani
+    według priorytetu, potem według kolejności zgłoszenia.
+    Działa w pętli zdarzeń bota, więc czekanie nie zajmuje żadnego wątku.
+    """
+
+    def __init__(self, limits):
+        self._limits = limits
+        self._buckets = {}
+        self._waiting = {} # model -> kopiec (priorytet, numer zgłoszenia)
+        self._tickets = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def _bucket(self, model):
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            rpm, burst = self._limits.get(model, self._limits['gemini-2.5-flash'])
+            bucket = self._buckets[model] = {
+                'rate': rpm / 60.0, 'capacity': burst, 'tokens': float(burst),
+                'updated': time.monotonic(), 'blocked_until': 0.0
+            }
+            self._waiting[model] = []
+        return bucket
+
+    @staticmethod
+    def _wait_time(bucket, now):
+        # Uzupełniamy tokeny proporcjonalnie do upływu czasu
+        bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+        bucket['updated'] = now
+        if now < bucket['blocked_until']:
+            return bucket['blocked_until'] - now
+        if bucket['tokens'] >= 1:
+            return 0.0
+        return (1 - bucket['tokens']) / bucket['rate']
+
+    def _notify(self):
+        # Budzimy wszystkich czekających; każdy sam sprawdzi, czy jest pierwszy w kolejce
+        self._wakeup.set()
+        self._wakeup.clear()
+
+    async def acquire(self, model, priority=GEMINI_PRIORITY_BACKGROUND, deadline=None):
+        """
+        Czeka na token dla modelu; zgłoszenia z wyższym priorytetem dostają go pierwsze.
+        Rzuca TimeoutError, jeśli token nie zdąży się pojawić przed `deadline` (time.monotonic()).
+        """
+        bucket = self._bucket(model)
+        waiting = self._waiting[model]
+        ticket = (priority, next(self._tickets))
+        heapq.heappush(waiting, ticket)
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(bucket, now)
+                if waiting[0] == ticket and wait <= 0:
+                    bucket['tokens'] -= 1
+                    return
+                if deadline is not None and now + wait > deadline:
+                    raise TimeoutError(f"Brak wolnego limitu dla '{model}' przed upływem terminu.")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(max(wait, 0.05), 1.0))
+                except TimeoutError:
+                    pass
+        finally:
+            # Także przy anulowaniu: zwalniamy miejsce w kolejce
+            waiting.remove(ticket)
+            heapq.heapify(waiting)
+            self._notify()
+
+    def queue_depths(self):
+        return {model: len(waiting) for model, waiting in self._waiting.items()}
+
+    def penalize(self, model, seconds):
+        """Wstrzymuje wydawanie tokenów dla modelu (np. po 429), dotyczy wszystkich wywołujących."""
+        bucket = self._bucket(model)
+        bucket['tokens'] = min(bucket['tokens'], 0.0)
+        bucket['blocked_until'] = max(bucket['blocked_until'], time.monotonic() + seconds)
+        self._notify()
+
+gemini_rate_limiter = GeminiRateLimiter(GEMINI_RATE_LIMITS)
+
+GEMINI_LIMITER_WAIT = metrics.REGISTRY.histogram(
+    'gemini_limiter_wait_seconds', 'Czas oczekiwania na token limitera Gemini.', ['model', 'priority'])
+GEMINI_LATENCY = metrics.REGISTRY.histogram(
+    'gemini_request_duration_seconds', 'Czas pojedynczego wywołania modelu Gemini.', ['model', 'outcome'])
+GEMINI_RETRIES = metrics.REGISTRY.counter(
+    'gemini_retries_total', 'Nieudane próby (429/503), po których ponawiamy lub przełączamy model.', ['model'])
+GEMINI_FALLBACKS = metrics.REGISTRY.counter(
+    'gemini_fallbacks_total', 'Przełączenia na model awaryjny.', ['model'])
+
+# --- KONIEC BLOKU: LIMITER ZAPYTAŃ GEMINI ---
+
+
 # --- NOWA ZAKTUALIZOWANA FUNKCJA POMOCNICZA DLA GEMINI ---
-def _generate_content_with_fallback(prompt: str, model_name: str):
+GEMINI_MAX_RETRIES = 5 # Liczba prób dla modelu podstawowego
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+GEMINI_BACKOFF_MAX_SECONDS = 30.0
+INTERACTION_TOKEN_LIFETIME = timedelta(minutes=15) # Po tym czasie Discord nie przyjmie już followupu
+INTERACTION_DEADLINE_MARGIN = timedelta(seconds=30)
+
+# Odpowiedź złożona ze strumienia (ma .text jak GenerateContentResponse)
+StreamedResponse = namedtuple("StreamedResponse", ["text"])
+
+_RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+def _is_retryable_gemini_error(error):
+    """Przeciążenie (503) lub limit (429) - warto ponowić. Inne błędy (np. 400) przerywają od razu."""
+    if getattr(error, 'code', None) in (429, 500, 503, 504):
+        return True
+    error_str = str(error)
+    return "503 UNAVAILABLE" in error_str or "overloaded" in error_str or "429 RESOURCE_EXHAUSTED" in error_str
+
+def _parse_retry_delay(error):
+    """Zwraca retryDelay (w sekundach) podany przez serwer w odpowiedzi 429, albo None."""
+    details = getattr(error, 'details', None)
+    try:
+        for item in details['error']['details']:
+            if 'retryDelay' in item:
+                return float(str(item['retryDelay']).rstrip('s'))
+    except (TypeError, KeyError, ValueError):
+        pass
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+def _backoff_delay(attempt):
+    """Wykładniczy backoff z losowym rozrzutem (połowa stała, połowa losowa)."""
+    cap = min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return cap / 2 + random.uniform(0, cap / 2)
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+def interaction_deadline(interaction):
+    """Termin (time.monotonic()), po którym odpowiedź na interakcję i tak nie dotrze do użytkownika."""
+    age = discord.utils.utcnow() - interaction.created_at
+    remaining = INTERACTION_TOKEN_LIFETIME - INTERACTION_DEADLINE_MARGIN - age
+    return time.monotonic() + max(remaining.total_seconds(), 0)
+
+async def _stream_content(model, prompt, config, on_progress):
+    """Czyta odpowiedź kawałkami i po każdym przekazuje dotychczasowy tekst do `on_progress`."""
+    text = ""
+    async for chunk in await gemini_client.aio.models.generate_content_stream(model=model, contents=prompt, config=config):
+        if not chunk.text: continue
+        text += chunk.text
+        try:
+            await on_progress(text)
+        except Exception as e:
+            # Błąd wyświetlania postępu nie może przerwać generowania
+            print(f"Blad aktualizacji postepu odpowiedzi: {e}")
+    return StreamedResponse(text)
+
+async def _generate_once(model, prompt, config, priority, deadline, on_progress=None):
+    """Jedno wywołanie modelu: token z limitera + zapytanie ograniczone terminem (opcjonalnie strumieniowo)."""
+    with GEMINI_LIMITER_WAIT.time(model=model, priority=priority):
+        await gemini_rate_limiter.acquire(model, priority, deadline)
+    remaining = _remaining(deadline)
+    if remaining is not None and remaining <= 0:
+        raise TimeoutError(f"Termin na odpowiedź '{model}' minął.")
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        if on_progress is not None:
+            request = _stream_content(model, prompt, config, on_progress)
+        else:
+            request = gemini_client.aio.models.generate_content(model=model, contents=prompt, config=config)
+        response = await asyncio.wait_for(request, timeout=remaining)
+        outcome = 'ok'
+        return response
+    except TimeoutError:
+        outcome = 'timeout'
+        raise
+    except Exception as e:
+        code = getattr(e, 'code', None)
+        outcome = str(code) if code else 'error'
+        raise
+    finally:
+        GEMINI_LATENCY.observe(time.perf_counter() - started, model=model, outcome=outcome)
+
+async def _generate_content_with_fallback(prompt: str, model_name: str, config=None,
+                                          priority=GEMINI_PRIORITY_BACKGROUND, deadline=None, on_progress=None):
     """
-    Uruchamia Gemini z logiką ponawiania prób i przełączania awaryjnego.
-    Przyjmuje model_name, aby wiedzieć, który model ma być podstawowym.
+    Uruchamia Gemini (asynchronicznie) z logiką ponawiania prób i przełączania awaryjnego.
+    Przyjmuje model_name, aby wiedzieć, który model ma być podstawowym,
+    opcjonalny config (np. odpowiedź w formacie JSON), priorytet w kolejce
+    limitera i termin `deadline` (time.monotonic()). Anulowanie zadania
+    przerywa oczekiwanie od razu, bez zajmowania wątku. Z `on_progress`
+    (korutyna przyjmująca dotychczasowy tekst) odpowiedź jest strumieniowana;
+    po ponowieniu tekst zaczyna się od nowa.
     """
     if not gemini_client:
         raise Exception("Klient Gemini nie jest skonfigurowany.")
+    # Cała sekwencja (z ponowieniami) zajmuje jedno miejsce w puli AI
+    return await AI_BULKHEAD.run_async(
+        _generate_with_retries, prompt, model_name, config or gemini_generation_config, priority, deadline, on_progress,
+        interactive=priority == GEMINI_PRIORITY_INTERACTIVE
+    )
 
+async def _generate_with_retries(prompt, model_name, config, priority, deadline, on_progress):
     primary_model = model_name
     fallback_model = None
-    max_retries = 5 # Liczba prób dla modelu podstawowego
 
     # Ustaw model awaryjny tylko jeśli podstawowy to 'pro'
     if primary_model == 'gemini-2.5-pro':
         fallback_model = 'gemini-2.5-flash'
 
     # --- Próba 1: Model Podstawowy (Pro lub Flash) z ponowieniami ---
-    for attempt in range(max_retries):
+    last_error = None
+    for attempt in range(GEMINI_MAX_RETRIES):
         try:
-            response = gemini_client.models.generate_content(
-                model=primary_model,
-                contents=prompt,
-                config=gemini_generation_config
-            )
+            response = await _generate_once(primary_model, prompt, config, priority, deadline, on_progress)
             print(f"Model '{primary_model}' zadziałał za {attempt + 1} próbą.")
             return response
+        except TimeoutError as e:
+            # Termin minął - nie ma sensu dalej zużywać limitu
+            last_error = e
+            break
         except Exception as e:
-            error_str = str(e)
-            # Sprawdzamy, czy to błąd przeciążenia (503) LUB limitu (429)
-            if "503 UNAVAILABLE" in error_str or "overloaded" in error_str or "429 RESOURCE_EXHAUSTED" in error_str:
-                print(f" próba {attempt + 1}/{max_retries} na '{primary_model}' nie powiodła się (Limit/Przeciążenie). Próbuję ponownie...")
-                # Czekamy dłużej przy błędach 429 (bo mówią nam, ile czekać), a krócej przy 503
-                if "retryDelay" in error_str:
-                    time.sleep(7) # Czekamy 7s, aby zmieścić się w limicie 10 RPM flasha
-                else:
-                    time.sleep(1 + attempt) # Prosty backoff dla 503
-                continue # Przejdź do kolejnej próby
-            else:
+            if not _is_retryable_gemini_error(e):
                 # Jeśli to inny błąd (np. 400 Bad Request), przerwij od razu
                 print(f"Krytyczny błąd Gemini (nie do ponowienia): {e}")
                 raise e # Rzuć błędem, aby zewnętrzna funkcja go złapała
 
+            last_error = e
+            GEMINI_RETRIES.inc(model=primary_model)
+            retry_delay = _parse_retry_delay(e)
+            if retry_delay is not None:
+                # Serwer podał, ile czekać: wstrzymujemy wspólny limiter modelu dla wszystkich
+                delay = retry_delay
+                gemini_rate_limiter.penalize(primary_model, delay)
+            else:
+                delay = _backoff_delay(attempt)
+            print(f" próba {attempt + 1}/{GEMINI_MAX_RETRIES} na '{primary_model}' nie powiodła się (Limit/Przeciążenie). Ponowienie za {delay:.1f}s...")
+
+            remaining = _remaining(deadline)
+            if remaining is not None and delay >= remaining:
+                print(f"Ponowienie na '{primary_model}' nie zmieści się w terminie.")
+                break
+            if attempt < GEMINI_MAX_RETRIES - 1 and retry_delay is None:
+                await asyncio.sleep(delay)
+
     # --- Próba 2: Model Awaryjny (tylko jeśli podstawowy to 'pro') ---
-    if fallback_model:
-        print(f"Wszystkie {max_retries} prób na '{primary_model}' nie powiodły się. Przełączam na model awaryjny '{fallback_model}'...")
+    remaining = _remaining(deadline)
+    if fallback_model and (remaining is None or remaining > 0):
+        print(f"Próby na '{primary_model}' nie powiodły się. Przełączam na model awaryjny '{fallback_model}'...")
+        GEMINI_FALLBACKS.inc(model=fallback_model)
         try:
-            response = gemini_client.models.generate_content(
-                model=fallback_model,
-                contents=prompt,
-                config=gemini_generation_config
-            )
+            response = await _generate_once(fallback_model, prompt, config, priority, deadline, on_progress)
             print(f"Model awaryjny '{fallback_model}' zadziałał.")
             return response
         except Exception as e:
             print(f"Model awaryjny '{fallback_model}' również zawiódł.")
             raise e # Rzuć ostatecznym błędem
+    elif isinstance(last_error, TimeoutError):
+        raise last_error
     else:
         # Jeśli nie było modelu awaryjnego (bo podstawowy to flash), rzuć błędem
-        raise Exception(f"Wszystkie {max_retries} prób na '{primary_model}' nie powiodły się. Brak modelu awaryjnego.")
+        raise Exception(f"Wszystkie próby na '{primary_model}' nie powiodły się. Brak modelu awaryjnego. Ostatni błąd: {last_error}")
 # --- KONIEC NOWEJ FUNKCJI ---
 
 
-def get_realtime_market_snapshot():
-    snapshot = {"fear_greed": "Brak danych", "top_gainers": "Brak danych", "latest_headlines": []}
-    try:
-        response = requests.get("https://api.alternative.me/fng/?limit=1")
-        response.raise_for_status()
-        data = response.json()['data'][0]
-        snapshot['fear_greed'] = f"{data['value']} ({data['value_classification']})"
-    except Exception as e:
-        print(f"Blad pobierania Fear & Greed: {e}")
+# --- POCZĄTEK BLOKU: WSPÓŁDZIELONY OBRAZ RYNKU (SNAPSHOT) ---
 
-    snapshot['top_gainers'] = get_top_gainers(3)
-    try:
-        feed = feedparser.parse(WATCHER_GURU_RSS_URL)
-        snapshot['latest_headlines'] = [entry.title for entry in feed.entries[:5]]
-    except Exception as e:
-        print(f"Blad pobierania naglowkow RSS: {e}")
-        snapshot['latest_headlines'] = ["Brak danych o newsach."]
+SNAPSHOT_FRESHNESS_SECONDS = int(os.environ.get('SNAPSHOT_FRESHNESS', 300)) # Ile sekund raporty i AI mogą używać tego samego snapshotu
+SNAPSHOT_PARTIAL_RETRY_SECONDS = 60 # Niepełny snapshot (któreś źródło zawiodło) odświeżamy szybciej
+SNAPSHOT_SOURCE_TIMEOUT_SECONDS = 8 # Osobny limit czasu dla każdego ze źródeł
+
+class MarketSnapshot:
+    """
+    Wersjonowany obraz rynku (F&G, top gainers, nagłówki) współdzielony
+    przez raporty i analizy AI w ramach okna świeżości.
+    """
+
+    def __init__(self, version, created_at, fear_greed, top_gainers, latest_headlines, missing_sources=()):
+        self.version = version
+        self.created_at = created_at
+        self.fear_greed = fear_greed
+        self.top_gainers = top_gainers
+        self.latest_headlines = latest_headlines
+        self.missing_sources = tuple(missing_sources) # Źródła, które nie odpowiedziały na czas
+
+    @property
+    def is_partial(self):
+        return bool(self.missing_sources)
+
+    def age_seconds(self):
+        return (datetime.datetime.now(TZ_POLAND) - self.created_at).total_seconds()
+
+    def fingerprint(self):
+        """Skrót samych danych (bez wersji i czasu) - te same dane dają ten sam skrót."""
+        payload = json.dumps([self.fear_greed, self.top_gainers, list(self.latest_headlines)], ensure_ascii=False)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+_snapshot_versions = itertools.count(1)
+snapshot_cache = AsyncTtlCache(ttl=SNAPSHOT_FRESHNESS_SECONDS, max_entries=1, name='market_snapshot')
+
+async def _fetch_fear_greed_text():
+    index, _ = await get_fear_greed_index() # To samo pobranie co wykres /fg
+    return f"{index.value} ({index.classification})"
+
+async def _fetch_latest_headlines():
+    # Czytamy wpisy trzymane przez FeedFetcher, zamiast pobierać kanał drugi raz
+    entries = await watcher_guru_feed.get_entries()
+    return [entry.title for entry in entries[:5]]
+
+async def _build_market_snapshot():
+    """Pobiera wszystkie źródła równolegle; snapshot trwa tyle, co najwolniejsze z nich."""
+    values = {"fear_greed": "Brak danych", "top_gainers": "Brak danych", "latest_headlines": ["Brak danych o newsach."]}
+    sources = {
+        "fear_greed": _fetch_fear_greed_text(),
+        "top_gainers": get_top_gainers(3, raise_errors=True), # Błąd ma trafić do missing_sources, nie do promptu
+        "latest_headlines": _fetch_latest_headlines(),
+    }
+    results = await asyncio.gather(
+        *(asyncio.wait_for(source, SNAPSHOT_SOURCE_TIMEOUT_SECONDS) for source in sources.values()),
+        return_exceptions=True
+    )
+    missing_sources = []
+    for name, result in zip(sources, results):
+        if isinstance(result, BaseException):
+            print(f"Blad pobierania zrodla snapshotu '{name}': {result!r}")
+            missing_sources.append(name)
+        else:
+            values[name] = result
+
+    return MarketSnapshot(
+        version=next(_snapshot_versions),
+        created_at=datetime.datetime.now(TZ_POLAND),
+        missing_sources=missing_sources,
+        **values
+    )
+
+async def get_realtime_market_snapshot():
+    """Zwraca aktualny snapshot rynku, budując nowy tylko gdy poprzedni się zestarzał."""
+    snapshot = await snapshot_cache.get_or_fetch('snapshot', _build_market_snapshot)
+    if snapshot.is_partial and snapshot.age_seconds() > SNAPSHOT_PARTIAL_RETRY_SECONDS:
+        snapshot_cache.invalidate('snapshot')
+        snapshot = await snapshot_cache.get_or_fetch('snapshot', _build_market_snapshot)
     return snapshot
 
-# --- ZMODYFIKOWANA FUNKCJA (USUNIĘTO heatmap) ---
-async def send_market_report(channel_or_ctx,
-                             title: str,
-                             color: discord.Color,
-                             include_fg: bool = False,
-                             include_gainers: bool = False,
-                             include_fed: bool = False,
-                             # include_heatmap: bool = False, <-- USUNIĘTO
-                             include_ai_analysis: bool = False):
-    
-    if isinstance(channel_or_ctx, (discord.Interaction, discord.Interaction.followup)):
-        followup_send = channel_or_ctx.followup.send if isinstance(channel_or_ctx, discord.Interaction) else channel_or_ctx.send
-    else:
-        followup_send = channel_or_ctx.send
+# --- KONIEC BLOKU: WSPÓŁDZIELONY OBRAZ RYNKU (SNAPSHOT) ---
+
+# --- POCZĄTEK BLOKU: PAMIĘĆ ANALIZ AI ---
+# Analiza zależy tylko od szablonu promptu i danych snapshotu, więc dla tych samych
+# danych model 'pro' jest wywoływany raz: kolejne /raport i /analiza_ai (oraz zadanie
+# generate_gemini_news) dostają gotowy tekst. Do trwającego wywołania dołącza tylko prośba
+# o tym samym lub niższym priorytecie (użytkownik nie czeka w kolejce zadań w tle); wspólne
+# wywołanie nie ma terminu żadnego z czekających - jest anulowane, gdy odejdzie ostatni -
+# a tekst w trakcie generowania trafia do wszystkich czekających. Błędy nie trafiają do pamięci.
+
+AI_ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get('AI_ANALYSIS_CACHE_TTL', 900))
+AI_ANALYSIS_MODEL = 'gemini-2.5-pro'
+
+AI_REPORT_PROMPT_TEMPLATE = (
+    "Jestes analitykiem rynku kryptowalut, tworzacym krotka analizę do automatycznego raportu na Discordzie. Na podstawie ponizszych, aktualnych danych, stworz zwięzle podsumowanie (2-3 zdania) ostatnich kilku godzin i przedstaw krotkoterminowa prognozę (1-2 zdania).\n\n"
+    "--- AKTUALNE DANE ---\n"
+    "1. Sentyment rynkowy (Fear & Greed Index): {fear_greed}\n"
+    "2. Najwięksi wygrani (Top Gainers): {top_gainers}\n"
+    "3. Ostatnie naglowki wiadomosci:\n- {headlines}\n"
+    "--- KONIEC DANYCH ---\n\n"
+    "Zadanie: Napisz krotka analizę. Skup się na ogolnym nastroju, zidentyfikuj kluczowe trendy i wskaz, czy rynek w najblizszych godzinach moze byc niestabilny, czy spodziewasz się kontynuacji trendu. Pisz po polsku, w profesjonalnym, ale przystępnym tonie."
+)
+
+AI_DETAILED_PROMPT_TEMPLATE = (
+    "Jestes ekspertem i analitykiem rynku kryptowalut. Twoim zadaniem jest stworzenie podsumowania dla kanalu na Discordzie na podstawie ponizszych, aktualnych danych. Analizuj TYLKO dostarczone informacje.\n\n"
+    "--- POCZĄTEK DANYCH (stan na {current_date}) ---\n"
+    "1. Ogolny sentyment rynkowy (Fear & Greed Index): {fear_greed}\n\n"
+    "2. Kryptowaluty z największymi wzrostami (Top Gainers):\n{top_gainers}\n\n"
+    "3. Najnowsze naglowki z wiadomosci:\n- {headlines}\n"
+    "--- KONIEC DANYCH ---\n\n"
+    "Zadanie: Na podstawie powyzszych danych, stworz listę **do 10 kluczowych punktow** opisujacych situację na rynku. **Posortuj punkty w kolejnosci od najwazniejszego (na gorze) do najmniej waznego (na dole).** Kazdy punkt powinien byc zwięzly i konkretny. Skup się na najwazniejszych wnioskach dotyczacych Bitcoina, Ethereum, sentymentu oraz trendow widocznych w newsach i wzrostach. Pisz po polsku."
+)
+
+AiAnalysis = namedtuple("AiAnalysis", ["text", "data_time"]) # data_time = created_at snapshotu, z którego powstała analiza
+
+ai_analysis_cache = AsyncTtlCache(ttl=AI_ANALYSIS_CACHE_TTL_SECONDS, max_entries=32, name='ai_analysis')
+
+class _SharedAnalysis:
+    """Jedno trwające wywołanie modelu i wszyscy, którzy na nie czekają."""
+
+    def __init__(self, priority, streaming):
+        self.priority = priority
+        self.streaming = streaming # Czy wywołanie idzie strumieniowo (tylko wtedy jest tekst częściowy)
+        self.task = None
+        self.waiters = 0
+        self.listeners = []
+        self.text = ""
+
+    async def broadcast(self, text):
+        self.text = text
+        for listener in list(self.listeners):
+            try:
+                await listener(text)
+            except Exception as e:
+                print(f"Blad przekazywania częściowej analizy AI: {e}")
+
+_ai_analysis_inflight = {} # klucz analizy -> lista _SharedAnalysis (po jednej na priorytet)
 
+def render_analysis_prompt(template, snapshot):
+    """Prompt zależy wyłącznie od snapshotu (także data), więc jest powtarzalny."""
+    return template.format(
+        current_date=snapshot.created_at.strftime("%Y-%m-%d %H:%M"),
+        fear_greed=snapshot.fear_greed,
+        top_gainers=snapshot.top_gainers,
+        headlines="\n- ".join(snapshot.latest_headlines),
+    )
+
+async def generate_market_analysis(template, snapshot, priority=GEMINI_PRIORITY_BACKGROUND, deadline=None, on_progress=None):
+    """
+    Zwraca AiAnalysis dla snapshotu. Kluczem pamięci jest skrót szablonu i skrót danych,
+    więc ta sama sytuacja rynkowa = jedno wywołanie modelu. Snapshot niepełny
+    (brak któregoś źródła) nie jest zapamiętywany - za chwilę będzie pełniejszy.
+    """
+    async def fetch(priority, deadline, on_progress):
+        response = await _generate_content_with_fallback(
+            render_analysis_prompt(template, snapshot),
+            model_name=AI_ANALYSIS_MODEL,
+            priority=priority,
+            deadline=deadline,
+            on_progress=on_progress
+        )
+        return AiAnalysis(response.text, snapshot.created_at)
+
+    if snapshot.is_partial:
+        return await fetch(priority, deadline, on_progress)
+    template_hash = hashlib.blake2b(template.encode('utf-8'), digest_size=8).hexdigest()
+    key = (AI_ANALYSIS_MODEL, template_hash, snapshot.fingerprint())
+    cached = ai_analysis_cache.peek(key)
+    if cached is not None:
+        return cached
+
+    # Mniejsza liczba = pilniej; dołączamy do wywołania co najmniej tak pilnego jak nasze
+    running = _ai_analysis_inflight.setdefault(key, [])
+    shared = min((s for s in running if s.priority <= priority), key=lambda s: s.priority, default=None)
+    if shared is None:
+        shared = _SharedAnalysis(priority, streaming=on_progress is not None)
+
+        async def run():
+            try:
+                analysis = await fetch(shared.priority, None, shared.broadcast if shared.streaming else None)
+                ai_analysis_cache.put(key, analysis)
+                return analysis
+            finally:
+                running.remove(shared)
+                if not running:
+                    _ai_analysis_inflight.pop(key, None)
+
+        shared.task = asyncio.ensure_future(run())
+        running.append(shared)
+
+    if on_progress is not None and shared.streaming:
+        shared.listeners.append(on_progress)
+        if shared.text:
+            await on_progress(shared.text) # Dołączający od razu widzi dotychczasowy tekst
+    shared.waiters += 1
+    try:
+        # Każdy czeka najwyżej do własnego terminu; shield - jego odejście nie przerywa innych
+        return await asyncio.wait_for(asyncio.shield(shared.task), timeout=_remaining(deadline))
+    finally:
+        shared.waiters -= 1
+        if on_progress in shared.listeners:
+            shared.listeners.remove(on_progress)
+        if not shared.waiters and not shared.task.done():
+            shared.task.cancel() # Nikt już nie czeka - nie zajmujemy limitu Gemini
+
+# --- KONIEC BLOKU: PAMIĘĆ ANALIZ AI ---
+
+# --- POCZĄTEK BLOKU: RAPORTY PRZYGOTOWANE Z WYPRZEDZENIEM ---
+
+REPORT_PREWARM_MINUTES = 10 # Tyle minut przed publikacją składamy dane i analizę AI
+REPORT_AI_GRACE_MINUTES = 5 # Tyle po czasie publikacji jeszcze czekamy na analizę AI
+REPORT_ON_DEMAND_MAX_AGE_SECONDS = 15 * 60 # /raport korzysta z gotowego raportu młodszego niż 15 min
+
+class MarketReport:
+    """Gotowe sekcje raportu; z nich na żądanie składamy embedy, bez ponownego pobierania danych."""
+
+    def __init__(self, built_at, ai_summary=None, gainers=None, fed_events=None, fear_greed_png=None, failed_sections=()):
+        self.built_at = built_at
+        self.ai_summary = ai_summary
+        self.gainers = gainers
+        self.fed_events = fed_events
+        self.fear_greed_png = fear_greed_png
+        self.failed_sections = frozenset(failed_sections) # Nazwy sekcji, w których jest komunikat o błędzie
+
+    def age_seconds(self):
+        return (datetime.datetime.now(TZ_POLAND) - self.built_at).total_seconds()
+
+    def _has(self, section):
+        return getattr(self, section) is not None and section not in self.failed_sections
+
+    def covers(self, include_fg=False, include_gainers=False, include_fed=False, include_ai_analysis=False):
+        # include_fg nie wymaga niczego: bez PNG raport pokazuje wykres z zapasowego URL-a
+        return ((not include_gainers or self._has('gainers'))
+                and (not include_fed or self._has('fed_events'))
+                and (not include_ai_analysis or self._has('ai_summary')))
+
+async def build_market_report(include_gainers=True, include_fed=True, include_ai_analysis=True,
+                              ai_priority=GEMINI_PRIORITY_REPORT, ai_deadline=None, reuse=None):
+    """
+    Pobiera sekcje raportu równolegle. Z raportu `reuse` bierze sekcje, które się
+    udały, a pobiera ponownie tylko brakujące i nieudane.
+    """
+    failed = set()
+
+    async def section(name, enabled, fetch):
+        if not enabled: return None
+        if reuse is not None and reuse._has(name):
+            return getattr(reuse, name)
+        try:
+            return await fetch()
+        except ReportSectionError as e:
+            failed.add(name)
+            return str(e)
+
+    async def ai_section():
+        if not gemini_client: return "Brak klucza API Gemini (GEMINI_API_KEY)."
+        return await get_ai_report_analysis(priority=ai_priority, deadline=ai_deadline, raise_errors=True)
+
+    async def fear_greed_section():
+        if reuse is not None and reuse.fear_greed_png: return reuse.fear_greed_png
+        return await get_fear_greed_png()
+
+    # Wykres F&G jest tani (pamięć per wartość i dzień), więc przygotowujemy go zawsze
+    ai_summary, gainers, fed_events, fear_greed_png = await asyncio.gather(
+        section('ai_summary', include_ai_analysis, ai_section),
+        section('gainers', include_gainers, lambda: get_top_gainers(10, raise_errors=True)),
+        section('fed_events', include_fed, lambda: get_fed_events(raise_errors=True)),
+        fear_greed_section())
+    return MarketReport(datetime.datetime.now(TZ_POLAND), ai_summary, gainers, fed_events, fear_greed_png, failed)
+
+def render_market_report(report, title, color, include_fg=False, include_gainers=False,
+                         include_fed=False, include_ai_analysis=False):
+    """Składa listę embedów z gotowego raportu (kolejność jak w wysyłanej wiadomości)."""
+    embeds = []
     if include_fg:
         fg_embed = discord.Embed(title=title, color=color)
         fg_embed.add_field(name="Indeks Fear & Greed", value=" ", inline=False)
-        fg_embed.set_image(url=get_fear_and_greed_image())
-        await followup_send(embed=fg_embed)
+        fg_embed.set_image(url=FEAR_GREED_ATTACHMENT_URL if report.fear_greed_png else get_fear_and_greed_image())
+        embeds.append(fg_embed)
         main_embed = discord.Embed(color=color)
     else:
         main_embed = discord.Embed(title=title, color=color)
 
     if include_ai_analysis and gemini_client:
-        # Ta funkcja teraz używa nowej logiki
-        ai_summary = await asyncio.to_thread(get_ai_report_analysis) 
-        main_embed.add_field(name="🤖 Analiza i Prognoza AI", value=ai_summary, inline=False)
+        main_embed.add_field(name="🤖 Analiza i Prognoza AI", value=report.ai_summary, inline=False)
     elif include_ai_analysis and not gemini_client:
         main_embed.add_field(name="🤖 Analiza AI", value="Brak klucza API Gemini (GEMINI_API_KEY).", inline=False)
 
     if include_gainers:
-        main_embed.add_field(name="🔥 Top 10 Gainers (24h)", value=get_top_gainers(10), inline=False)
+        main_embed.add_field(name="🔥 Top 10 Gainers (24h)", value=report.gainers, inline=False)
 
     if include_fed:
-        main_embed.add_field(name="🇺🇸 Wydarzenia FED (14 dni)", value=get_fed_events(), inline=False)
+        main_embed.add_field(name="🇺🇸 Wydarzenia FED (14 dni)", value=report.fed_events, inline=False)
 
     if main_embed.fields:
-        await followup_send(embed=main_embed)
+        embeds.append(main_embed)
+    return embeds
+
+class ReportPipeline:
+    """
+    Przechowuje raporty zbudowane przed czasem publikacji. Zadanie publikujące
+    bierze gotowy raport (albo czeka na trwające budowanie), a /raport
+    korzysta z ostatniego raportu, dopóki jest wystarczająco świeży.
+    """
+
+    def __init__(self):
+        self._prepared = {} # slot -> MarketReport
+        self._pending = {} # slot -> trwające zadanie budowania
+        self.latest = None
+
+    def prepare(self, slot, ai_deadline=None):
+        """Startuje (lub zwraca trwające) budowanie pełnego raportu dla slotu."""
+        task = self._pending.get(slot)
+        if task is None:
+            task = asyncio.ensure_future(self._build(slot, ai_deadline))
+            self._pending[slot] = task
+        return task
+
+    async def _build(self, slot, ai_deadline):
+        try:
+            report = await build_market_report(ai_deadline=ai_deadline)
+            self._prepared[slot] = report
+            self.remember(report)
+            if report.failed_sections:
+                print(f"[Raporty] Raport dla slotu {slot} przygotowany, ale z błędami w sekcjach: {', '.join(sorted(report.failed_sections))}.")
+            else:
+                print(f"[Raporty] Raport dla slotu {slot} przygotowany z wyprzedzeniem.")
+            return report
+        finally:
+            self._pending.pop(slot, None)
+
+    async def take(self, slot, max_age):
+        """Zwraca gotowy raport dla slotu (lub czeka na trwające budowanie); None, jeśli go nie ma."""
+        report = self._prepared.pop(slot, None)
+        if report is not None and report.age_seconds() <= max_age:
+            return report
+        task = self._pending.get(slot)
+        if task is not None:
+            try:
+                return await asyncio.shield(task)
+            except Exception as e:
+                print(f"[Raporty] Budowanie raportu dla slotu {slot} nie powiodło się: {e}")
+        return None
+
+    def remember(self, report):
+        """Zapamiętuje raport dla /raport - tylko kompletny, aby nie serwować komunikatów o błędach przez 15 min."""
+        if not report.failed_sections:
+            self.latest = report
+
+    def fresh_latest(self, max_age, **sections):
+        report = self.latest
+        if report is not None and report.age_seconds() <= max_age and report.covers(**sections):
+            return report
+        return None
+
+report_pipeline = ReportPipeline()
+
+# --- KONIEC BLOKU: RAPORTY PRZYGOTOWANE Z WYPRZEDZENIEM ---
+
+# --- ZMODYFIKOWANA FUNKCJA (USUNIĘTO heatmap) ---
+async def send_market_report(channel_or_ctx,
+                             title: str,
+                             color: discord.Color,
+                             include_fg: bool = False,
+                             include_gainers: bool = False,
+                             include_fed: bool = False,
+                             # include_heatmap: bool = False, <-- USUNIĘTO
+                             include_ai_analysis: bool = False,
+                             ai_priority: int = GEMINI_PRIORITY_REPORT,
+                             ai_deadline: float = None,
+                             report: MarketReport = None):
+    
+    # Interaction -> followup; kanał lub webhook followup -> zwykłe .send
+    # (discord.Interaction.followup to property, nie typ, więc nie może trafić do isinstance)
+    if isinstance(channel_or_ctx, discord.Interaction):
+        followup_send = channel_or_ctx.followup.send
+    else:
+        followup_send = channel_or_ctx.send
+
+    if report is None:
+        # Brak gotowego raportu: budujemy go teraz (wszystkie sekcje równolegle)
+        report = await build_market_report(include_gainers, include_fed, include_ai_analysis, ai_priority, ai_deadline)
+
+    for embed in render_market_report(report, title, color, include_fg, include_gainers, include_fed, include_ai_analysis):
+        if embed.image.url == FEAR_GREED_ATTACHMENT_URL:
+            await followup_send(embed=embed, file=fear_greed_file(report.fear_greed_png))
+        else:
+            await followup_send(embed=embed)
 
     # --- CAŁY BLOK IF INCLUDE_HEATMAP ZOSTAŁ USUNIĘTY ---
 
 # --- ZAKTUALIZOWANA FUNKCJA ---
-def get_ai_report_analysis():
+async def get_ai_report_analysis(priority=GEMINI_PRIORITY_REPORT, deadline=None, raise_errors=False):
     if not gemini_client: return "Analiza AI wylaczona (brak klucza)."
     print("Pobieranie danych do analizy AI dla raportu (Model: PRO)...")
-    market_data = get_realtime_market_snapshot()
-    headlines_str = "\n- ".join(market_data['latest_headlines'])
+    market_data = await get_realtime_market_snapshot()
 
     try:
-        prompt = (
-            f"Jestes analitykiem rynku kryptowalut, tworzacym krotka analizę do automatycznego raportu na Discordzie. Na podstawie ponizszych, aktualnych danych, stworz zwięzle podsumowanie (2-3 zdania) ostatnich kilku godzin i przedstaw krotkoterminowa prognozę (1-2 zdania).\n\n"
-            f"--- AKTUALNE DANE ---\n"
-            f"1. Sentyment rynkowy (Fear & Greed Index): {market_data['fear_greed']}\n"
-            f"2. Najwięksi wygrani (Top Gainers): {market_data['top_gainers']}\n"
-            f"3. Ostatnie naglowki wiadomosci:\n- {headlines_str}\n"
-            f"--- KONIEC DANYCH ---\n\n"
-            f"Zadanie: Napisz krotka analizę. Skup się na ogolnym nastroju, zidentyfikuj kluczowe trendy i wskaz, czy rynek w najblizszych godzinach moze byc niestabilny, czy spodziewasz się kontynuacji trendu. Pisz po polsku, w profesjonalnym, ale przystępnym tonie."
-        )
-
-        # NOWA METODA: Wywołujemy funkcję pomocniczą z modelem 'pro'
-        response = _generate_content_with_fallback(prompt, model_name='gemini-2.5-pro')
-        
-        return response.text.strip()
+        # Model 'pro' przez pamięć analiz: ten sam snapshot = jedno wywołanie
+        analysis = await generate_market_analysis(AI_REPORT_PROMPT_TEMPLATE, market_data, priority=priority, deadline=deadline)
+        return analysis.text.strip()
     except Exception as e:
         print(f"Blad podczas generowania analizy AI do raportu: {e}")
-        return "Nie udalo się wygenerowac analizy z powodu blędu."
+        message = "Nie udalo się wygenerowac analizy z powodu blędu."
+        if raise_errors: raise ReportSectionError(message) from e
+        return message
+
+
+# --- POCZĄTEK BLOKU: ODPOWIEDZI STRUMIENIOWE ---
 
+AI_STREAM_EDIT_INTERVAL_SECONDS = 1.5 # Discord pozwala na ok. 5 edycji / 5 s na wiadomość
+AI_STREAM_MAX_CHARS = 4000 # Limit opisu embeda to 4096 znaków
+
+class StreamingEmbedReply:
+    """
+    Pokazuje częściową odpowiedź modelu w jednej efemerycznej wiadomości followup.
+    `update` tylko zapamiętuje najnowszy tekst, a wysyłkę i edycje (nie częściej niż
+    co AI_STREAM_EDIT_INTERVAL_SECONDS) robi jedno zadanie w tle, więc generowanie
+    nie czeka na Discorda. `finish` zatrzymuje to zadanie i wstawia ostateczny embed.
+    """
+
+    def __init__(self, interaction, title, color):
+        self.interaction = interaction
+        self.title = title
+        self.color = color
+        self.message = None
+        self._latest = None
+        self._changed = asyncio.Event()
+        self._updater = None
+        self._first_send = None # Wysyłka pierwszej wiadomości; nie przerywamy jej razem z zadaniem
+
+    async def update(self, text):
+        if not text.strip():
+            return
+        self._latest = text
+        self._changed.set()
+        if self._updater is None:
+            self._updater = asyncio.create_task(self._run_updates())
+
+    async def _run_updates(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            embed = discord.Embed(title=self.title, description=f"{self._latest[:AI_STREAM_MAX_CHARS]} ▌", color=self.color)
+            embed.set_footer(text="Generowanie analizy...")
+            try:
+                if self.message is None:
+                    self._first_send = asyncio.ensure_future(self.interaction.followup.send(embed=embed, ephemeral=True, wait=True))
+                    self.message = await asyncio.shield(self._first_send)
+                else:
+                    await self.message.edit(embed=embed)
+            except Exception as e:
+                print(f"Nie udalo sie zaktualizowac czesciowej analizy: {e}")
+            await asyncio.sleep(AI_STREAM_EDIT_INTERVAL_SECONDS)
+
+    async def finish(self, embed):
+        if self._updater is not None:
+            self._updater.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._updater
+        if self.message is None and self._first_send is not None:
+            with contextlib.suppress(discord.HTTPException):
+                self.message = await self._first_send # Edytujemy ją zamiast wysyłać drugą
+        if self.message is None:
+            await self.interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        try:
+            await self.message.edit(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Nie udalo sie podmienic wiadomosci, wysylam nowa: {e}")
+            await self.interaction.followup.send(embed=embed, ephemeral=True)
+
+# --- KONIEC BLOKU: ODPOWIEDZI STRUMIENIOWE ---
 
 # --- Komendy ukosnikowe ---
 
 @bot.tree.command(name="raport", description="Generuje pelny raport rynkowy na zadanie.")
 async def slash_report(interaction: discord.Interaction):
     await interaction.response.defer(thinking=True, ephemeral=True) # <-- ZMIANA: ephemeral=True
-    await send_market_report(interaction, title="Raport Rynkowy na zadanie", color=discord.Color.gold(), include_fg=True, include_gainers=True, include_fed=True, include_ai_analysis=True) # <-- ZMIANA: usunięto heatmap
+    # Świeży, gotowy raport (np. przygotowany przed publikacją) wysyłamy od razu
+    report = report_pipeline.fresh_latest(REPORT_ON_DEMAND_MAX_AGE_SECONDS, include_gainers=True, include_fed=True, include_ai_analysis=True)
+    if report is None:
+        report = await build_market_report(ai_priority=GEMINI_PRIORITY_INTERACTIVE, ai_deadline=interaction_deadline(interaction))
+        report_pipeline.remember(report)
+    await send_market_report(interaction, title="Raport Rynkowy na zadanie", color=discord.Color.gold(), include_fg=True, include_gainers=True, include_fed=True, include_ai_analysis=True, report=report) # <-- ZMIANA: usunięto heatmap
 
 @bot.tree.command(name="fg", description="Wyswietla aktualny Indeks Fear & Greed.")
 async def slash_fg(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True) # Przy pustej pamięci pobranie indeksu może potrwać dłużej niż 3 s
     embed = discord.Embed(title="Fear & Greed Index", color=discord.Color.gold())
-    embed.set_image(url=get_fear_and_greed_image())
-    await interaction.response.send_message(embed=embed, ephemeral=True) # <-- ZMIANA: ephemeral=True
+    png = await get_fear_greed_png()
+    if png:
+        embed.set_image(url=FEAR_GREED_ATTACHMENT_URL)
+        await interaction.followup.send(embed=embed, file=fear_greed_file(png))
+    else:
+        embed.set_image(url=get_fear_and_greed_image())
+        await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="gainers", description="Pokazuje 10 kryptowalut z największym wzrostem w ciagu 24h.")
 async def slash_gainers(interaction: discord.Interaction):
-    description_text = get_top_gainers(10)
+    description_text = await get_top_gainers(10)
     embed = discord.Embed(title="🔥 Top 10 Gainers (24h)", description=description_text, color=discord.Color.green())
     await interaction.response.send_message(embed=embed, ephemeral=True) # <-- ZMIANA: ephemeral=True
 
@@ -544,20 +2586,41 @@ async def slash_gainers(interaction: discord.Interaction):
 
 @bot.tree.command(name="fed", description="Pokazuje nadchodzace kluczowe wydarzenia FED (14 dni).")
 async def slash_fed(interaction: discord.Interaction):
-    description_text = get_fed_events()
+    description_text = await get_fed_events()
     embed = discord.Embed(title="🇺🇸 Nadchodzace wydarzenia FED (14 dni)", description=description_text, color=discord.Color.blue())
     await interaction.response.send_message(embed=embed, ephemeral=True) # <-- ZMIANA: ephemeral=True
 
 # --- ZMODYFIKOWANA KOMENDA /analiza ---
-@bot.tree.command(name="analiza", description="Wyświetla uproszczoną analizę techniczną dla wybranej krypto.")
-@discord.app_commands.describe(coin="ID kryptowaluty (np. 'bitcoin', 'ethereum', 'solana')")
+@bot.tree.command(name="analiza", description="Wyświetla uproszczoną analizę techniczną dla wybranej krypto (lub kilku, po przecinku).")
+@discord.app_commands.describe(coin="ID kryptowaluty (np. 'bitcoin') lub kilka ID po przecinku (np. 'bitcoin, ethereum, solana')")
 async def slash_analysis(interaction: discord.Interaction, coin: str):
     await interaction.response.defer(ephemeral=True) # Używamy defer, bo robimy API call
     
-    coin_id = coin.lower().strip()
+    coin_ids = parse_coin_ids(coin)
+    if coin_index.ready:
+        # Symbole i nazwy zamieniamy na ID lokalnie; nieznane wpisy nie trafiają do sieci
+        resolved = [coin_index.resolve(c) for c in coin_ids]
+        unknown = [c for c, r in zip(coin_ids, resolved) if r is None]
+        if unknown:
+            embed = discord.Embed(
+                title="Błąd Analizy",
+                description=f"Nie znaleziono kryptowaluty: `{', '.join(unknown)}`. Skorzystaj z podpowiedzi przy wpisywaniu nazwy.",
+                color=discord.Color.red()
+            )
+            await interaction.followup.send(embed=embed)
+            return
+        coin_ids = list(dict.fromkeys(resolved))
+
+    if len(coin_ids) > 1:
+        # Tryb wsadowy: jedno zapytanie do API i obliczenia dla wszystkich monet naraz
+        embed = await get_multi_coin_analysis_embed(coin_ids)
+        await interaction.followup.send(embed=embed)
+        return
+
+    coin_id = coin_ids[0] if coin_ids else coin.lower().strip()
     
-    # Wywołujemy nową funkcję w osobnym wątku, aby nie blokować bota
-    analysis_text, current_price = await asyncio.to_thread(get_single_coin_analysis, coin_id)
+    # Funkcja jest asynchroniczna, więc nie blokuje bota
+    analysis_text, current_price = await get_single_coin_analysis(coin_id, interactive=True)
     
     if current_price:
         # Sukces
@@ -575,6 +2638,19 @@ async def slash_analysis(interaction: discord.Interaction, coin: str):
         )
         
     await interaction.followup.send(embed=embed) # Odpowiedź jest już efemeryczna
+
+@slash_analysis.autocomplete('coin')
+async def coin_autocomplete(interaction: discord.Interaction, current: str):
+    """Podpowiedzi z lokalnego indeksu; przy liście po przecinku uzupełniamy ostatni element."""
+    head, _, last = current.rpartition(',')
+    head = f"{head}, " if head else ""
+    choices = []
+    for coin_id in coin_index.suggest(last):
+        symbol, name = coin_index.coins[coin_id]
+        value = f"{head}{coin_id}"
+        if len(value) > 100: continue # Limit długości wartości w Discordzie
+        choices.append(discord.app_commands.Choice(name=f"{name} ({symbol.upper()}) - {coin_id}"[:100], value=value))
+    return choices
 # --- KONIEC ZMIAN W /analiza ---
 
 
@@ -593,11 +2669,13 @@ async def slash_analiza_ai(interaction: discord.Interaction):
     # Dajemy znać Discordowi, że "myślimy", bo Gemini potrzebuje czasu
     await interaction.response.defer(thinking=True, ephemeral=True) # <-- ZMIANA: ephemeral=True
     
-    # Wywołujemy naszą nową funkcję, aby pobrała embed
-    analysis_embed = await get_detailed_ai_analysis_embed() # Ta funkcja teraz używa nowej logiki
+    # Odpowiedź strumieniowa: pierwsze zdania widać po kilku sekundach, wiadomość jest edytowana w miarę postępu
+    # Termin = ważność tokenu interakcji; po nim nie zużywamy już limitu Gemini
+    reply = StreamingEmbedReply(interaction, AI_ANALYSIS_TITLE, AI_ANALYSIS_COLOR)
+    analysis_embed = await get_detailed_ai_analysis_embed(deadline=interaction_deadline(interaction), on_progress=reply.update)
     
-    # Wysyłamy wynik jako followup
-    await interaction.followup.send(embed=analysis_embed)
+    # Ostateczny embed (taki sam jak bez strumieniowania) zastępuje częściowy tekst
+    await reply.finish(analysis_embed)
 
 
 # --- Zdarzenia startowe i synchronizacja ---
@@ -606,13 +2684,17 @@ async def slash_analiza_ai(interaction: discord.Interaction):
 async def on_ready():
     print(f'Zalogowano jako {bot.user}')
     try:
-        load_sent_urls_from_file() # <-- NOWA LINIA: Wczytaj historię
+        WATCHER_GURU_SENT_URLS.load() # Wczytywane tylko raz na proces, nie przy każdym ponownym połączeniu
+        translation_cache.load() # Wczytywane tylko raz na proces
+        await coin_index.load() # JSON i budowa indeksu w puli wątków, nie w pętli gatewaya
         
         # Sprawdzanie, czy taski już działają, aby uniknąć restartu
+        if not prewarm_reports.is_running(): prewarm_reports.start()
         if not report_0600.is_running(): report_0600.start()
         if not report_1200.is_running(): report_1200.start()
         if not report_2000.is_running(): report_2000.start()
         if not watcher_guru_forwarder.is_running(): watcher_guru_forwarder.start()
+        if COINGECKO_API_KEY and not refresh_coin_index.is_running(): refresh_coin_index.start()
         
         # POPRAWKA: Usunięto wywołanie fin_watch_forwarder (z Twojego kodu)
         
@@ -627,55 +2709,125 @@ async def on_ready():
 
 # --- ZADANIA CYKLICZNE (tasks.loop) ---
 
-@tasks.loop(time=datetime.time(hour=6, minute=0, tzinfo=TZ_POLAND))
-async def report_0600():
+TASK_DURATION = metrics.REGISTRY.histogram(
+    'task_loop_duration_seconds', 'Czas jednego przebiegu zadania cyklicznego.', ['task', 'outcome'])
+
+def timed_task(func):
+    """Dekorator (pod @tasks.loop) mierzący czas każdego przebiegu zadania."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await func(*args, **kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            TASK_DURATION.observe(time.perf_counter() - started, task=func.__name__, outcome=outcome)
+    return wrapper
+
+@tasks.loop(hours=24)
+@timed_task
+async def refresh_coin_index():
+    try:
+        await coin_index.refresh()
+    except Exception as e:
+        print(f"Blad odswiezania indeksu monet: {e}")
+
+REPORT_SLOTS = {
+    '0600': datetime.time(hour=6, minute=0, tzinfo=TZ_POLAND),
+    '1200': datetime.time(hour=12, minute=0, tzinfo=TZ_POLAND),
+    '2000': datetime.time(hour=20, minute=0, tzinfo=TZ_POLAND),
+}
+
+def _report_prewarm_time(slot_time):
+    start = datetime.datetime.combine(date.today(), slot_time) - timedelta(minutes=REPORT_PREWARM_MINUTES)
+    return start.timetz()
+
+def _upcoming_report_slot():
+    """Zwraca (slot, moment publikacji) najbliższego raportu w ciągu najbliższej godziny."""
+    now = datetime.datetime.now(TZ_POLAND)
+    for slot, slot_time in REPORT_SLOTS.items():
+        publish_at = datetime.datetime.combine(now.date(), slot_time)
+        if publish_at < now - timedelta(minutes=1):
+            publish_at += timedelta(days=1)
+        if publish_at - now <= timedelta(hours=1):
+            return slot, publish_at
+    return None, None
+
+@tasks.loop(time=[_report_prewarm_time(t) for t in REPORT_SLOTS.values()])
+@timed_task
+async def prewarm_reports():
+    slot, publish_at = _upcoming_report_slot()
+    if slot is None: return
+    # Analiza AI może trwać do kilku minut po czasie publikacji, potem raport idzie bez niej
+    seconds_left = (publish_at - datetime.datetime.now(TZ_POLAND)).total_seconds() + REPORT_AI_GRACE_MINUTES * 60
+    report_pipeline.prepare(slot, ai_deadline=time.monotonic() + seconds_left)
+
+async def publish_report(slot, title, color, **sections):
     channel = bot.get_channel(CHANNEL_ID)
     if not channel: return
+    report = await report_pipeline.take(slot, max_age=(REPORT_PREWARM_MINUTES + REPORT_AI_GRACE_MINUTES) * 60)
+    if report is None:
+        print(f"[Raporty] Brak gotowego raportu dla slotu {slot}, buduję na bieżąco.")
+    elif not report.covers(**sections):
+        # Przygotowanie przed czasem częściowo się nie udało: ponawiamy tylko nieudane sekcje
+        print(f"[Raporty] Ponawiam nieudane sekcje raportu dla slotu {slot}: {', '.join(sorted(report.failed_sections))}.")
+        report = await build_market_report(
+            sections.get('include_gainers', False), sections.get('include_fed', False), sections.get('include_ai_analysis', False),
+            ai_deadline=time.monotonic() + REPORT_AI_GRACE_MINUTES * 60, reuse=report)
+        report_pipeline.remember(report)
+    await send_market_report(channel, title, color, report=report, **sections)
+
+@tasks.loop(time=REPORT_SLOTS['0600'])
+@timed_task
+async def report_0600():
     title = f"Poranny Raport Rynkowy - {date.today().strftime('%d-%m-%Y')}"
     # ZMIANA: usunięto heatmap=True
-    await send_market_report(channel, title, discord.Color.gold(), include_fg=True, include_gainers=True, include_fed=True, include_ai_analysis=True)
+    await publish_report('0600', title, discord.Color.gold(), include_fg=True, include_gainers=True, include_fed=True, include_ai_analysis=True)
 
-@tasks.loop(time=datetime.time(hour=12, minute=0, tzinfo=TZ_POLAND))
+@tasks.loop(time=REPORT_SLOTS['1200'])
+@timed_task
 async def report_1200():
-    channel = bot.get_channel(CHANNEL_ID)
-    if not channel: return
     # ZMIANA: usunięto heatmap=True
-    await send_market_report(channel, "Raport Poludniowy", discord.Color.green(), include_gainers=True, include_ai_analysis=True)
+    await publish_report('1200', "Raport Poludniowy", discord.Color.green(), include_gainers=True, include_ai_analysis=True)
 
-@tasks.loop(time=datetime.time(hour=20, minute=0, tzinfo=TZ_POLAND))
+@tasks.loop(time=REPORT_SLOTS['2000'])
+@timed_task
 async def report_2000():
-    channel = bot.get_channel(CHANNEL_ID)
-    if not channel: return
     # ZMIANA: usunięto heatmap=True
-    await send_market_report(channel, "Raport Wieczorny", discord.Color.purple(), include_gainers=True, include_ai_analysis=True)
+    await publish_report('2000', "Raport Wieczorny", discord.Color.purple(), include_gainers=True, include_ai_analysis=True)
+
 
+AI_ANALYSIS_TITLE = "📈 Szczegółowa Analiza Rynku (AI)"
+AI_ANALYSIS_COLOR = discord.Color.from_rgb(70, 130, 180)
 
 # --- ZAKTUALIZOWANA FUNKCJA ---
-async def get_detailed_ai_analysis_embed():
+async def get_detailed_ai_analysis_embed(priority=GEMINI_PRIORITY_INTERACTIVE, deadline=None, on_progress=None):
     """
     Pobiera dane rynkowe, generuje szczegółową analizę AI przez Gemini
-    i zwraca gotowy obiekt discord.Embed.
+    i zwraca gotowy obiekt discord.Embed. `on_progress` dostaje częściowy
+    tekst w trakcie generowania (tryb strumieniowy).
     """
     if not gemini_client:
-        embed = discord.Embed(title="📈 Szczegółowa Analiza Rynku (AI)", description="Analiza AI jest wyłączona (brak klucza API Gemini).", color=discord.Color.red())
+        embed = discord.Embed(title=AI_ANALYSIS_TITLE, description="Analiza AI jest wyłączona (brak klucza API Gemini).", color=discord.Color.red())
         return embed
 
     print("Rozpoczynam generowanie szczegolowej analizy AI (Model: PRO)...")
-    market_data = get_realtime_market_snapshot()
-    headlines_str = "\n- ".join(market_data['latest_headlines'])
-    current_date = datetime.datetime.now(TZ_POLAND).strftime("%Y-%m-%d %H:%M")
+    market_data = await get_realtime_market_snapshot()
 
     try:
-        prompt = (f"Jestes ekspertem i analitykiem rynku kryptowalut. Twoim zadaniem jest stworzenie podsumowania dla kanalu na Discordzie na podstawie ponizszych, aktualnych danych. Analizuj TYLKO dostarczone informacje.\n\n--- POCZĄTEK DANYCH (stan na {current_date}) ---\n1. Ogolny sentyment rynkowy (Fear & Greed Index): {market_data['fear_greed']}\n\n2. Kryptowaluty z największymi wzrostami (Top Gainers):\n{market_data['top_gainers']}\n\n3. Najnowsze naglowki z wiadomosci:\n- {headlines_str}\n--- KONIEC DANYCH ---\n\nZadanie: Na podstawie powyzszych danych, stworz listę **do 10 kluczowych punktow** opisujacych situację na rynku. **Posortuj punkty w kolejnosci od najwazniejszego (na gorze) do najmniej waznego (na dole).** Kazdy punkt powinien byc zwięzly i konkretny. Skup się na najwazniejszych wnioskach dotyczacych Bitcoina, Ethereum, sentymentu oraz trendow widocznych w newsach i wzrostach. Pisz po polsku.")
-        
-        # NOWA METODA: Wywołujemy funkcję pomocniczą z modelem 'pro'
-        response = await asyncio.to_thread(
-            _generate_content_with_fallback,
-            prompt,
-            model_name='gemini-2.5-pro'
+        # Model 'pro' przez pamięć analiz: ten sam snapshot = jedno wywołanie
+        analysis = await generate_market_analysis(
+            AI_DETAILED_PROMPT_TEMPLATE,
+            market_data,
+            priority=priority,
+            deadline=deadline,
+            on_progress=on_progress
         )
+        current_date = analysis.data_time.strftime("%Y-%m-%d %H:%M")
         
-        embed = discord.Embed(title="📈 Szczegółowa Analiza Rynku (AI)", description=response.text, color=discord.Color.from_rgb(70, 130, 180))
+        embed = discord.Embed(title=AI_ANALYSIS_TITLE, description=analysis.text, color=AI_ANALYSIS_COLOR)
         embed.set_footer(text=f"Wygenerowano przez Gemini AI | Dane z {current_date}")
         return embed
         
@@ -685,14 +2837,17 @@ async def get_detailed_ai_analysis_embed():
         
         if "503 UNAVAILABLE" in str(e) or "overloaded" in str(e):
             error_message = "Nie udało się wygenerować analizy. Model AI jest obecnie przeciążony. Spróbuj ponownie za chwilę."
+        elif isinstance(e, BulkheadFullError):
+            error_message = "Bot generuje teraz zbyt wiele analiz AI. Spróbuj ponownie za chwilę."
             
-        embed = discord.Embed(title="📈 Szczegółowa Analiza Rynku (AI)", description=error_message, color=discord.Color.red())
+        embed = discord.Embed(title=AI_ANALYSIS_TITLE, description=error_message, color=discord.Color.red())
         return embed
 
 
 # --- ZAKTUALIZOWANA PĘTLA ---
 # --- ZAKTUALIZOWANA PĘTLA (z logiką ponowienia 3x5 min) ---
 @tasks.loop(hours=2)
+@timed_task
 async def generate_gemini_news():
     if not gemini_client: return
     channel = bot.get_channel(CHANNEL_ID)
@@ -706,7 +2861,7 @@ async def generate_gemini_news():
         print(f"[Zadanie: generate_gemini_news] Próba {attempt + 1}/{max_task_retries} wygenerowania analizy...")
         
         # Krok 1: Wywołaj funkcję, która ma WŁASNĄ logikę (5xPro + 1xFlash)
-        analysis_embed = await get_detailed_ai_analysis_embed()
+        analysis_embed = await get_detailed_ai_analysis_embed(priority=GEMINI_PRIORITY_BACKGROUND)
         
         # Krok 2: Sprawdzamy, czy embed jest sukcesem (NIE jest czerwony)
         if analysis_embed and analysis_embed.color != discord.Color.red():
@@ -730,43 +2885,212 @@ async def generate_gemini_news():
 
 # --- ZAKTUALIZOWANA PĘTLA ---
 @tasks.loop(minutes=5)
+@timed_task
 async def watcher_guru_forwarder():
     channel = bot.get_channel(WATCHER_GURU_CHANNEL_ID)
     if not channel: return
-    feed = feedparser.parse(WATCHER_GURU_RSS_URL)
-    for entry in reversed(feed.entries[:5]): 
-        await process_and_send_news(channel, entry, "Watcher Guru", WATCHER_GURU_SENT_URLS)
-        # Czekamy 7s, aby zmieścić się w limicie 10 RPM (1 co 6s) dla modelu 'flash'
-        await asyncio.sleep(7) 
+    # Wszystkie kanały z NEWS_FEEDS (domyślnie tylko Watcher Guru) w jednym cyklu
+    await news_ingestion.run_cycle(channel)
+
+
+# --- POCZĄTEK BLOKU: TŁUMACZENIE NAGŁÓWKÓW ---
+
+NEWS_TITLE_TAGS = ["@WatcherGuru", "@WatcherGur", "@WatcherGu", "@WatcherG", "@Watcher", "@Watche", "@Watch", "@Watc", "@FINNWatch", "@Fin_Watch", "@Finn", "@Fin"]
+
+TRANSLATION_PROMPT = "Jestes profesjonalnym tlumaczem dla kanalu informacyjnego. Twoim zadaniem jest stworzenie jednego, zwięzlego i naturalnie brzmiacego tlumaczenia. Nie podawaj zadnych alternatyw, wariantow w nawiasach, uwag ani dodatkowych wyjasnień. Podaj tylko ostateczna, najlepsza wersję."
+
+# Odpowiedź wsadowa: lista obiektów {"id": numer nagłówka, "pl": tłumaczenie}
+BATCH_TRANSLATION_CONFIG = types.GenerateContentConfig(
+    safety_settings=gemini_safety_settings,
+    response_mime_type="application/json",
+    response_schema=types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "id": types.Schema(type=types.Type.INTEGER),
+                "pl": types.Schema(type=types.Type.STRING),
+            },
+            required=["id", "pl"],
+        ),
+    ),
+)
+
+def clean_news_title(title):
+    """Usuwa z nagłówka (także uciętych) tagi typu @WatcherGuru."""
+    for tag in NEWS_TITLE_TAGS:
+        title = title.replace(tag, "")
+    return title.strip()
+
+def normalize_news_title(title):
+    """
+    Klucz porównawczy nagłówka: bez tagów, małe litery, bez nadmiarowych spacji.
+    Interpunkcji nie usuwamy - znaki przy liczbach ("-0.5%", "$100") zmieniają sens.
+    """
+    return " ".join(clean_news_title(title).casefold().split())
 
+class TranslationCache:
+    """
+    Trwała pamięć tłumaczeń nagłówków. Kluczem jest krótki skrót
+    znormalizowanego tytułu, rozmiar ogranicza usuwanie najdawniej
+    używanych wpisów (LRU). Plik to zwarta lista par [skrót, tłumaczenie].
+    """
 
-# --- ZAKTUALIZOWANA FUNKCJA (Z DODANYM ZAPISEM DO PLIKU) ---
-async def process_and_send_news(channel, entry, source_name, sent_urls_deque):
-    if entry.link in sent_urls_deque: return
-    
-    tags_to_remove = ["@WatcherGuru", "@WatcherGur", "@WatcherGu", "@WatcherG", "@Watcher", "@Watche", "@Watch", "@Watc", "@FINNWatch", "@Fin_Watch", "@Finn", "@Fin"]
-    title_original = entry.title
-    for tag in tags_to_remove:
-        title_original = title_original.replace(tag, "")
-    title_original = title_original.strip()
-
-    title_pl = title_original # Domyślnie, jeśli AI zawiedzie
-    if gemini_client: # Tłumaczymy tylko jeśli AI jest dostępne
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._loaded = False
+        self._dirty = False
+
+    @staticmethod
+    def key_for(title):
+        return hashlib.blake2b(normalize_news_title(title).encode('utf-8'), digest_size=8).hexdigest()
+
+    def load(self):
+        """Wczytuje plik raz na proces (kolejne wywołania nic nie robią)."""
+        if self._loaded: return
+        self._loaded = True
         try:
-            prompt = (f"Jestes profesjonalnym tlumaczem dla kanalu informacyjnego. Twoim zadaniem jest stworzenie jednego, zwięzlego i naturalnie brzmiacego tlumaczenia. Nie podawaj zadnych alternatyw, wariantow w nawiasach, uwag ani dodatkowych wyjasnień. Podaj tylko ostateczna, najlepsza wersję.\n\nPrzetlumacz na polski: \"{title_original}\"")
-            
-            # NOWA METODA: Wywołujemy funkcję pomocniczą z modelem 'flash'
-            print(f"Rozpoczynam tłumaczenie (Model: FLASH)...: {title_original}")
-            response = await asyncio.to_thread(
-                _generate_content_with_fallback,
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for key, translation in json.load(f)[-self.max_entries:]:
+                    self._entries[key] = translation
+            print(f"Załadowano {len(self._entries)} tłumaczeń z pliku {self.path}.")
+        except FileNotFoundError:
+            print(f"Plik {self.path} nie znaleziony, startuję z pustą pamięcią tłumaczeń.")
+        except Exception as e:
+            print(f"Błąd ładowania pamięci tłumaczeń: {e}")
+
+    def get(self, title):
+        key = self.key_for(title)
+        translation = self._entries.get(key)
+        if translation is not None:
+            self._entries.move_to_end(key)
+        return translation
+
+    def put(self, title, translation):
+        key = self.key_for(title)
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    async def save(self):
+        """
+        Zapisuje plik, tylko gdy coś się zmieniło. Migawka i zdjęcie flagi dzieją się
+        w pętli (put() zmieniający pamięć w trakcie zapisu ustawi flagę ponownie),
+        a sam zapis - w puli 'parsing'.
+        """
+        if not self._dirty: return
+        items = list(self._entries.items())
+        self._dirty = False
+        await PARSING_BULKHEAD.run(self._write, items)
+
+    def _write(self, items):
+        """Zapis atomowy (plik tymczasowy + os.replace); przy błędzie wpisy czekają na kolejny zapis."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Błąd zapisu pamięci tłumaczeń: {e}")
+            self._dirty = True
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX_ENTRIES)
+
+async def translate_title(title_original):
+    """Tłumaczy jeden nagłówek (pamięć tłumaczeń, potem model 'flash'); w razie błędu zwraca oryginał."""
+    cached = translation_cache.get(title_original)
+    if cached is not None: return cached
+    if not gemini_client: return title_original
+    try:
+        prompt = f"{TRANSLATION_PROMPT}\n\nPrzetlumacz na polski: \"{title_original}\""
+        print(f"Rozpoczynam tłumaczenie (Model: FLASH)...: {title_original}")
+        response = await _generate_content_with_fallback(
+            prompt,
+            model_name='gemini-2.5-flash'
+        )
+        title_pl = response.text.strip()
+        translation_cache.put(title_original, title_pl)
+        return title_pl
+    except Exception as e:
+        print(f"Blad tlumaczenia Gemini: {e}")
+        return title_original
+
+def _parse_batch_translations(response_text, count):
+    """Mapuje odpowiedź JSON na listę tłumaczeń; None dla pozycji, które nie przeszły walidacji."""
+    translations = [None] * count
+    try:
+        items = json.loads(response_text)
+    except (TypeError, ValueError):
+        return translations
+    if not isinstance(items, list):
+        return translations
+    for item in items:
+        if not isinstance(item, dict): continue
+        index, text = item.get("id"), item.get("pl")
+        if not isinstance(index, int) or not 0 <= index < count or translations[index] is not None: continue
+        if not isinstance(text, str) or not text.strip(): continue
+        translations[index] = text.strip()
+    return translations
+
+async def translate_titles_batch(titles):
+    """
+    Tłumaczy listę nagłówków: najpierw z pamięci tłumaczeń, resztę jednym
+    zapytaniem ze strukturalną odpowiedzią. Tylko pozycje, które nie przeszły
+    walidacji, są tłumaczone pojedynczo.
+    """
+    translations = [translation_cache.get(title) for title in titles]
+    missing = [i for i, translation in enumerate(translations) if translation is None]
+    if not missing or not gemini_client:
+        return [translation or title for translation, title in zip(translations, titles)]
+
+    if len(missing) > 1:
+        missing_titles = [titles[i] for i in missing]
+        try:
+            payload = json.dumps([{"id": i, "en": title} for i, title in enumerate(missing_titles)], ensure_ascii=False)
+            prompt = (f"{TRANSLATION_PROMPT}\n\nPrzetlumacz na polski kazdy z ponizszych naglowkow. "
+                      f"Zwroc liste obiektow JSON z polami \"id\" (takie samo jak na wejsciu) i \"pl\" (tlumaczenie).\n\n{payload}")
+            print(f"Rozpoczynam tłumaczenie wsadowe {len(missing_titles)} nagłówków (Model: FLASH)...")
+            response = await _generate_content_with_fallback(
                 prompt,
-                model_name='gemini-2.5-flash'
+                model_name='gemini-2.5-flash',
+                config=BATCH_TRANSLATION_CONFIG
             )
-            title_pl = response.text.strip()
+            for i, translation in zip(missing, _parse_batch_translations(response.text, len(missing_titles))):
+                if translation is not None:
+                    translations[i] = translation
+                    translation_cache.put(titles[i], translation)
         except Exception as e:
-            print(f"Blad tlumaczenia Gemini: {e}")
-            # W razie błędu, używamy oryginalnego tytułu
-            title_pl = title_original
+            print(f"Blad tlumaczenia wsadowego Gemini: {e}")
+
+    for i in missing:
+        if translations[i] is None:
+            translations[i] = await translate_title(titles[i])
+    await translation_cache.save()
+    return translations
+
+# --- KONIEC BLOKU: TŁUMACZENIE NAGŁÓWKÓW ---
+
+
+def find_image_in_html(content_html):
+    """Zwraca adres pierwszego obrazka <img> z treści wpisu albo None."""
+    soup = BeautifulSoup(content_html, 'html.parser')
+    img_tag = soup.find('img') # Znajdź pierwszy tag <img>
+    if img_tag and img_tag.has_attr('src'):
+        return img_tag['src']
+    return None
+
+# --- ZAKTUALIZOWANA FUNKCJA (Z DODANYM ZAPISEM DO PLIKU) ---
+async def process_and_send_news(channel, entry, source_name, sent_urls, title_pl=None):
+    if entry.link in sent_urls: return
+    
+    title_original = clean_news_title(entry.title)
+    if title_pl is None: # Pojedyncze wywołanie (bez tłumaczenia wsadowego)
+        title_pl = await translate_title(title_original)
+        await translation_cache.save()
     
     # --- NOWA, ZAKTUALIZOWANA LOGIKA WYSZUKIWANIA OBRAZKA ---
     image_url = None
@@ -789,10 +3113,8 @@ async def process_and_send_news(channel, entry, source_name, sent_urls_deque):
         content_html = entry.get('summary', '') or entry.get('content', [{}])[0].get('value', '')
         if content_html:
             try:
-                soup = BeautifulSoup(content_html, 'html.parser')
-                img_tag = soup.find('img') # Znajdź pierwszy tag <img>
-                if img_tag and img_tag.has_attr('src'):
-                    image_url = img_tag['src']
+                # Parsowanie HTML w puli 'parsing', aby nie blokować pętli Discorda
+                image_url = await PARSING_BULKHEAD.run(find_image_in_html, content_html)
             except Exception as e:
                 print(f"Błąd parsowania HTML (BeautifulSoup): {e}")
     # --- KONIEC NOWEJ LOGIKI ---
@@ -809,23 +3131,220 @@ async def process_and_send_news(channel, entry, source_name, sent_urls_deque):
     await channel.send(embed=embed)
     
     # --- NOWA LOGIKA ZAPISU DO PLIKU ---
-    sent_urls_deque.append(entry.link) # Dodaj do pamięci RAM
     try:
-        # Zapisz całą kolejkę (jako listę) do pliku, aby przetrwać restart
-        with open(SENT_URLS_FILE, 'w') as f:
-            json.dump(list(sent_urls_deque), f)
+        # Indeks w RAM; dziennik (restart) zapisuje NewsIngestion raz na cykl
+        sent_urls.add(entry.link)
     except Exception as e:
         print(f"KRYTYCZNY BŁĄD zapisu URL do pliku: {e}")
     # --- KONIEC NOWEJ LOGIKI ZAPISU ---
 
 
-# --- GŁÓWNE URUCHOMIENIE (Flask przez Gunicorn, Bot w wątku) ---
-# Gunicorn uruchomi ten plik i będzie szukał obiektu 'app'.
-# My wykorzystujemy ten fakt, aby uruchomić bota w osobnym wątku.
+# --- POCZĄTEK BLOKU: WIELE ŹRÓDEŁ WIADOMOŚCI (WYKRYWANIE DUPLIKATÓW) ---
+# Ta sama wiadomość z dwóch serwisów ma inny URL i zwykle lekko inny nagłówek.
+# Nagłówki porównujemy przez MinHash na 4-znakowych shinglach znormalizowanego
+# tytułu, a kandydatów wskazuje indeks LSH (pasma sygnatury), więc sprawdzenie
+# nowego nagłówka nie zależy od liczby zapamiętanych. Duplikatem jest tylko
+# podobny nagłówek z INNEGO kanału, z ostatnich kilku godzin i z tymi samymi
+# liczbami - kolejne wiadomości jednego serwisu ("BTC $100k", potem "$110k")
+# zawsze są wysyłane. Duplikat jest oznaczany jako wysłany: nie idzie do
+# tłumaczenia ani na kanał.
+
+NEWS_ENTRIES_PER_FEED = 5 # Tyle najnowszych wpisów z każdego kanału sprawdzamy w cyklu
+NEWS_SHINGLE_SIZE = 4
+NEWS_MINHASH_PERMUTATIONS = 64
+NEWS_MINHASH_BANDS = 16 # 16 pasm x 4 wiersze: kandydaci od ok. 50% podobieństwa
+NEWS_DUPLICATE_THRESHOLD = float(os.environ.get('NEWS_DUPLICATE_THRESHOLD', 0.6)) # Szacowane podobieństwo Jaccarda
+NEWS_DUPLICATE_WINDOW_SECONDS = int(os.environ.get('NEWS_DUPLICATE_WINDOW', 6 * 3600)) # Ta sama historia z innego serwisu pojawia się w ciągu godzin
+NEWS_DUPLICATE_MEMORY = 2000 # Górny limit wpisów indeksu (niezależnie od okna)
+
+_MINHASH_PRIME = (1 << 61) - 1
+# Serwisy różnie oznaczają pilne wiadomości; prefiks nie mówi nic o treści
+_NEWS_WIRE_PREFIX = re.compile(r"^(just in|breaking news|breaking|update)\s*:?\s+")
+_NEWS_PUNCTUATION = re.compile(r"[^\w\s$%.,+\-]") # Znaki liczb ($, %, kropka, przecinek, znak) zostają
+_NEWS_NUMBER = re.compile(r"[-+]?\d+(?:[.,]\d+)*%?")
+
+class NearDuplicateIndex:
+    """
+    Indeks MinHash/LSH ostatnich nagłówków. `check_and_add` zwraca podobny nagłówek
+    z innego źródła albo None. Ten sam wpis (klucz, np. URL) nie jest swoim
+    duplikatem, więc wpis, którego nie udało się wysłać, wróci w kolejnym cyklu.
+    """
+
+    def __init__(self, permutations=NEWS_MINHASH_PERMUTATIONS, bands=NEWS_MINHASH_BANDS, threshold=NEWS_DUPLICATE_THRESHOLD,
+                 window_seconds=NEWS_DUPLICATE_WINDOW_SECONDS, max_entries=NEWS_DUPLICATE_MEMORY, shingle_size=NEWS_SHINGLE_SIZE):
+        if permutations % bands:
+            raise ValueError("Liczba permutacji musi być wielokrotnością liczby pasm.")
+        rng = random.Random(0x6E657773) # Stałe ziarno: te same sygnatury w każdym procesie
+        self._coefficients = [(rng.randrange(1, _MINHASH_PRIME), rng.randrange(0, _MINHASH_PRIME)) for _ in range(permutations)]
+        self.rows = permutations // bands
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.shingle_size = shingle_size
+        self._entries = OrderedDict() # id -> NewsFingerprint
+        self._buckets = {} # (numer pasma, wartości pasma) -> zbiór id
+        self._next_id = 0
+
+    @staticmethod
+    def comparison_text(title):
+        text = _NEWS_WIRE_PREFIX.sub("", normalize_news_title(title))
+        return " ".join(_NEWS_PUNCTUATION.sub(" ", text).split())
+
+    def signature(self, title):
+        text = self.comparison_text(title)
+        if len(text) <= self.shingle_size:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles]
+        return tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in self._coefficients)
+
+    def fingerprint(self, title, key=None, source=None, seen_at=None):
+        text = self.comparison_text(title)
+        return NewsFingerprint(self.signature(title), tuple(sorted(_NEWS_NUMBER.findall(text))), title, key, source,
+                               time.time() if seen_at is None else seen_at)
+
+    def _bands(self, signature):
+        for band, start in enumerate(range(0, len(signature), self.rows)):
+            yield band, signature[start:start + self.rows]
+
+    @staticmethod
+    def similarity(first, second):
+        """Szacowane podobieństwo Jaccarda dwóch sygnatur."""
+        return sum(a == b for a, b in zip(first, second)) / len(first)
+
+    def _candidates(self, signature):
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self._buckets.get(band, ()))
+        return [self._entries[entry_id] for entry_id in candidates]
+
+    def find(self, fingerprint):
+        """Najbardziej podobny wpis z innego źródła, z okna czasowego i z tymi samymi liczbami; None, jeśli brak."""
+        best, best_score = None, self.threshold
+        for stored in self._candidates(fingerprint.signature):
+            if (stored.source == fingerprint.source or stored.numbers != fingerprint.numbers
+                    or abs(fingerprint.seen_at - stored.seen_at) > self.window_seconds):
+                continue
+            score = self.similarity(fingerprint.signature, stored.signature)
+            if score >= best_score:
+                best, best_score = stored, score
+        return best
+
+    def add(self, fingerprint):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = fingerprint
+        for band in self._bands(fingerprint.signature):
+            self._buckets.setdefault(band, set()).add(entry_id)
+        cutoff = fingerprint.seen_at - self.window_seconds
+        while self._entries and (len(self._entries) > self.max_entries or next(iter(self._entries.values())).seen_at < cutoff):
+            old_id, old = self._entries.popitem(last=False)
+            for band in self._bands(old.signature):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def check_and_add(self, title, key=None, source=None, seen_at=None):
+        fingerprint = self.fingerprint(title, key, source, seen_at)
+        if key is not None and any(stored.key == key for stored in self._candidates(fingerprint.signature)):
+            return None # Wpis już jest w indeksie (np. poprzednia wysyłka się nie udała)
+        duplicate = self.find(fingerprint)
+        if duplicate is not None:
+            return duplicate.title
+        self.add(fingerprint)
+        return None
+
+NewsFingerprint = namedtuple("NewsFingerprint", ["signature", "numbers", "title", "key", "source", "seen_at"])
+
+class NewsIngestion:
+    """
+    Jeden cykl dla wszystkich kanałów: równoległe pobranie, odrzucenie URL-i już
+    wysłanych i duplikatów między serwisami, jedno wsadowe tłumaczenie i wysyłka.
+    Dodanie źródła nie zwiększa więc liczby zapytań do Gemini ani wiadomości.
+    """
+
+    def __init__(self, feeds, sent_urls, duplicates):
+        self.feeds = feeds
+        self.sent_urls = sent_urls
+        self.duplicates = duplicates
+        self._seeded = False
+
+    def _seed(self):
+        """Po restarcie indeks jest pusty: uczymy go nagłówków już wysłanych, widocznych w kanałach."""
+        self._seeded = True
+        for feed in self.feeds:
+            for entry in feed.fetcher.entries:
+                if entry.get('link') in self.sent_urls and entry.get('title'):
+                    # Czas publikacji (jeśli jest), aby stare wiadomości nie trafiły do okna duplikatów
+                    published = entry.get('published_parsed') or entry.get('updated_parsed')
+                    seen_at = timegm(published) if published else None
+                    self.duplicates.check_and_add(entry.title, entry.link, feed.name, seen_at)
+
+    async def collect_new_entries(self):
+        """Zwraca listę (nazwa źródła, wpis) nowych, unikalnych wpisów (od najstarszego w każdym kanale)."""
+        # Zapytania warunkowe: przy 304 nic nie jest pobierane ani parsowane
+        results = await asyncio.gather(*(feed.fetcher.poll() for feed in self.feeds), return_exceptions=True)
+        for feed, result in zip(self.feeds, results):
+            if isinstance(result, Exception):
+                print(f"Blad pobierania RSS {feed.name}: {result}")
+        if not self._seeded:
+            self._seed()
+
+        new_entries = []
+        for feed in self.feeds:
+            for entry in reversed(feed.fetcher.entries[:NEWS_ENTRIES_PER_FEED]):
+                link, title = entry.get('link'), entry.get('title')
+                if not link or not title or link in self.sent_urls: continue
+                duplicate_of = self.duplicates.check_and_add(title, link, feed.name)
+                if duplicate_of is not None:
+                    print(f"[{feed.name}] Pomijam duplikat: {clean_news_title(title)!r} ~ {clean_news_title(duplicate_of)!r}")
+                    try:
+                        self.sent_urls.add(link)
+                    except Exception as e:
+                        print(f"KRYTYCZNY BŁĄD zapisu URL do pliku: {e}")
+                    continue
+                new_entries.append((feed.name, entry))
+        return new_entries
+
+    async def run_cycle(self, channel):
+        try:
+            new_entries = await self.collect_new_entries()
+            if not new_entries: return
+
+            # Wszystkie nowe nagłówki z cyklu (ze wszystkich kanałów) tłumaczymy jednym zapytaniem do Gemini
+            titles_pl = await translate_titles_batch([clean_news_title(entry.title) for _, entry in new_entries])
+            for (source_name, entry), title_pl in zip(new_entries, titles_pl):
+                await process_and_send_news(channel, entry, source_name, self.sent_urls, title_pl=title_pl)
+        finally:
+            # Jeden zapis dziennika (z fsync) na cykl, w puli 'parsing' zamiast w pętli Discorda
+            await PARSING_BULKHEAD.run(self.sent_urls.flush)
+
+# Jedna pamięć wysłanych URL-i dla wszystkich kanałów
+news_ingestion = NewsIngestion(news_feeds, WATCHER_GURU_SENT_URLS, NearDuplicateIndex())
+
+# --- KONIEC BLOKU: WIELE ŹRÓDEŁ WIADOMOŚCI (WYKRYWANIE DUPLIKATÓW) ---
 
-print("Inicjalizacja wątku bota Discord...")
-bot_thread = Thread(target=run_discord_bot_sync)
-bot_thread.start()
 
-# Blok 'if __name__ == "__main__":' nie jest już potrzebny, 
-# ponieważ Gunicorn importuje ten plik jako moduł, aby znaleźć 'app'.
\ No newline at end of file
+# --- GŁÓWNE URUCHOMIENIE (Flask przez Gunicorn, Bot w wątku) ---
+# Gunicorn uruchomi ten plik i będzie szukał obiektu 'app'.
+# Przy imporcie (BOT_MODE=auto) startujemy wątek wyboru lidera: bota uruchomi
+# tylko jeden worker na hoście, niezależnie od liczby workerów i przeładowań.
+# Osobny punkt wejścia: `python bot.py` uruchamia samego bota (gunicorn wtedy z BOT_MODE=web).
+
+if __name__ == "__main__":
+    if not try_acquire_bot_lock():
+        print("Bot działa już na tym hoście (blokada zajęta). Kończę.")
+        sys.exit(1)
+    try:
+        run_discord_bot_sync()
+    finally:
+        release_bot_lock()
+elif BOT_MODE == 'web':
+    print("BOT_MODE=web: ten proces obsługuje tylko Flask, bot nie zostanie uruchomiony.")
+else:
+    print("Inicjalizacja wątku bota Discord...")
+    bot_thread = Thread(target=_bot_leader_election, name="bot-leader-election", daemon=True)
+    bot_thread.start()
@@ -0,0 +1,288 @@
+# Plik: indicators.py
+# Wskaźniki techniczne na NumPy: RSI, EMA/SMA, MACD, Wstęgi Bollingera, ATR.
+# Każda funkcja przyjmuje szereg 1-D (czas) albo macierz 2-D (monety x czas)
+# i zwraca wynik o tym samym kształcie (NaN tam, gdzie brakuje historii).
+
+import numpy as np
+
+_BLOCK_SIZE = 128 # Długość bloku dla rekurencji liczonej macierzowo
+
+
+def _as_2d(values):
+    """Zamienia wejście na macierz float64 (monety x czas); drugi element mówi, czy było 1-D."""
+    array = np.asarray(values, dtype=np.float64)
+    if array.ndim == 1:
+        return array[np.newaxis, :], True
+    if array.ndim != 2:
+        raise ValueError("Oczekiwano szeregu 1-D albo macierzy 2-D (monety x czas).")
+    return array, False
+
+
+def _restore(array, was_1d):
+    return array[0] if was_1d else array
+
+
+def _linear_recurrence(x, alpha, initial):
+    """
+    Liczy y[t] = (1 - alpha) * y[t-1] + alpha * x[t] dla każdego wiersza,
+    zaczynając od y[-1] = initial. Zamiast pętli po elementach używamy
+    bloków: wewnątrz bloku wynik to iloczyn z dolnotrójkątną macierzą wag,
+    więc pętla w Pythonie wykonuje się tylko raz na _BLOCK_SIZE próbek.
+    """
+    rows, length = x.shape
+    out = np.empty_like(x)
+    state = np.asarray(initial, dtype=np.float64).reshape(rows)
+    if length == 0:
+        return out
+
+    decay = 1.0 - alpha
+    block = min(length, _BLOCK_SIZE)
+    exponents = np.arange(block)
+    lags = exponents[:, np.newaxis] - exponents[np.newaxis, :]
+    # weights[t, i] = alpha * decay^(t - i) dla i <= t; potęgi <= 1, więc bez przepełnień
+    weights = np.where(lags >= 0, alpha * decay ** np.maximum(lags, 0), 0.0)
+    carry = decay ** (exponents + 1) # Wpływ stanu sprzed bloku na kolejne próbki
+
+    for start in range(0, length, block):
+        stop = min(start + block, length)
+        size = stop - start
+        out[:, start:stop] = x[:, start:stop] @ weights[:size, :size].T + state[:, np.newaxis] * carry[:size]
+        state = out[:, stop - 1]
+    return out
+
+
+def sma(values, period):
+    """Prosta średnia krocząca (okno `period`)."""
+    data, was_1d = _as_2d(values)
+    out = np.full_like(data, np.nan)
+    if data.shape[1] >= period:
+        cumsum = np.cumsum(np.insert(data, 0, 0.0, axis=1), axis=1)
+        out[:, period - 1:] = (cumsum[:, period:] - cumsum[:, :-period]) / period
+    return _restore(out, was_1d)
+
+
+def ema(values, span):
+    """Wykładnicza średnia krocząca (alpha = 2 / (span + 1), start od pierwszej wartości)."""
+    data, was_1d = _as_2d(values)
+    out = np.empty_like(data)
+    if data.shape[1]:
+        out[:, 0] = data[:, 0]
+        out[:, 1:] = _linear_recurrence(data[:, 1:], 2.0 / (span + 1), data[:, 0])
+    return _restore(out, was_1d)
+
+
+def _wilder_averages(data, period):
+    """Średnie zysków i strat Wildera dla cen od indeksu `period` (seed = średnia z pierwszych `period` zmian)."""
+    deltas = np.diff(data, axis=1)
+    gains = np.clip(deltas, 0, None)
+    losses = np.clip(-deltas, 0, None)
+    seed_gain = gains[:, :period].mean(axis=1)
+    seed_loss = losses[:, :period].mean(axis=1)
+    alpha = 1.0 / period
+
+    avg_gain = np.empty((data.shape[0], deltas.shape[1] - period + 1))
+    avg_loss = np.empty_like(avg_gain)
+    avg_gain[:, 0], avg_loss[:, 0] = seed_gain, seed_loss
+    avg_gain[:, 1:] = _linear_recurrence(gains[:, period:], alpha, seed_gain)
+    avg_loss[:, 1:] = _linear_recurrence(losses[:, period:], alpha, seed_loss)
+    return avg_gain, avg_loss
+
+
+def _rsi_from_averages(avg_gain, avg_loss):
+    avg_gain = np.asarray(avg_gain, dtype=np.float64)
+    avg_loss = np.asarray(avg_loss, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi_values = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # Brak strat: 100 przy zyskach, 50 przy płaskim rynku
+    return np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), rsi_values)
+
+
+def rsi(prices, period=14):
+    """RSI Wildera; pierwsze `period` wartości to NaN."""
+    data, was_1d = _as_2d(prices)
+    out = np.full_like(data, np.nan)
+    if data.shape[1] > period:
+        avg_gain, avg_loss = _wilder_averages(data, period)
+        out[:, period:] = _rsi_from_averages(avg_gain, avg_loss)
+    return _restore(out, was_1d)
+
+
+def macd(values, fast=12, slow=26, signal=9):
+    """Zwraca (linia MACD, linia sygnału, histogram)."""
+    data, was_1d = _as_2d(values)
+    macd_line = ema(data, fast) - ema(data, slow)
+    signal_line = ema(macd_line, signal)
+    return (_restore(macd_line, was_1d), _restore(signal_line, was_1d),
+            _restore(macd_line - signal_line, was_1d))
+
+
+def bollinger_bands(values, period=20, num_std=2.0):
+    """Zwraca (środek, górna wstęga, dolna wstęga); odchylenie standardowe populacji z okna."""
+    data, was_1d = _as_2d(values)
+    middle = sma(data, period)
+    std = np.full_like(data, np.nan)
+    if data.shape[1] >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(data, period, axis=1)
+        std[:, period - 1:] = windows.std(axis=-1)
+    return (_restore(middle, was_1d), _restore(middle + num_std * std, was_1d),
+            _restore(middle - num_std * std, was_1d))
+
+
+def true_range(high, low, close):
+    """True Range; dla pierwszej świecy to po prostu high - low."""
+    high, was_1d = _as_2d(high)
+    low, _ = _as_2d(low)
+    close, _ = _as_2d(close)
+    out = high - low
+    previous_close = close[:, :-1]
+    out[:, 1:] = np.maximum.reduce([out[:, 1:], np.abs(high[:, 1:] - previous_close), np.abs(low[:, 1:] - previous_close)])
+    return _restore(out, was_1d)
+
+
+def atr(high, low, close, period=14):
+    """Average True Range Wildera; seed = średnia z pierwszych `period` wartości TR (od drugiej świecy)."""
+    tr, was_1d = _as_2d(true_range(high, low, close))
+    out = np.full_like(tr, np.nan)
+    if tr.shape[1] > period:
+        seed = tr[:, 1:period + 1].mean(axis=1)
+        out[:, period] = seed
+        out[:, period + 1:] = _linear_recurrence(tr[:, period + 1:], 1.0 / period, seed)
+    return _restore(out, was_1d)
+
+
+# --- Stan przyrostowy: nowy punkt ceny aktualizuje wskaźnik w O(1) ---
+
+class EmaState:
+    """Przyrostowa EMA; `value` może być liczbą albo wektorem (jedna wartość na monetę)."""
+
+    def __init__(self, span, value=None):
+        self.alpha = 2.0 / (span + 1)
+        self.value = value
+
+    @classmethod
+    def from_values(cls, values, span):
+        series, _ = _as_2d(values)
+        last = ema(series, span)[:, -1]
+        return cls(span, last[0] if np.ndim(values) == 1 else last)
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = self.value + self.alpha * (value - self.value)
+        return self.value
+
+
+class RsiState:
+    """
+    Przyrostowy RSI Wildera. Po `from_prices` każdy kolejny punkt ceny
+    kosztuje O(1). Działa dla jednej monety i dla wektora monet.
+    """
+
+    def __init__(self, period=14):
+        self.period = period
+        self.last_price = None
+        self.avg_gain = None
+        self.avg_loss = None
+        self._seed_deltas = []
+
+    @classmethod
+    def from_prices(cls, prices, period=14):
+        state = cls(period)
+        data, was_1d = _as_2d(prices)
+        if data.shape[1] <= period:
+            for column in data.T:
+                state.update(column[0] if was_1d else column)
+            return state
+        avg_gain, avg_loss = _wilder_averages(data, period)
+        state.avg_gain = avg_gain[0, -1] if was_1d else avg_gain[:, -1]
+        state.avg_loss = avg_loss[0, -1] if was_1d else avg_loss[:, -1]
+        state.last_price = data[0, -1] if was_1d else data[:, -1]
+        return state
+
+    @property
+    def value(self):
+        if self.avg_gain is None:
+            return None
+        result = _rsi_from_averages(self.avg_gain, self.avg_loss)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def update(self, price):
+        """Dodaje nowy punkt ceny i zwraca bieżący RSI (None, dopóki brakuje `period` zmian)."""
+        price = np.asarray(price, dtype=np.float64)
+        if self.last_price is None:
+            self.last_price = price
+            return None
+        delta = price - self.last_price
+        self.last_price = price
+        gain, loss = np.maximum(delta, 0.0), np.maximum(-delta, 0.0)
+
+        if self.avg_gain is None:
+            self._seed_deltas.append((gain, loss))
+            if len(self._seed_deltas) < self.period:
+                return None
+            self.avg_gain = np.mean([g for g, _ in self._seed_deltas], axis=0)
+            self.avg_loss = np.mean([l for _, l in self._seed_deltas], axis=0)
+            self._seed_deltas = []
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        return self.value
+
+
+# --- Implementacje referencyjne (czysty Python) do walidacji ---
+
+def _reference_ema(values, span):
+    alpha = 2.0 / (span + 1)
+    out = [float(values[0])]
+    for value in values[1:]:
+        out.append(out[-1] + alpha * (float(value) - out[-1]))
+    return out
+
+
+def _reference_rsi(prices, period=14):
+    out = [float('nan')] * len(prices)
+    if len(prices) <= period:
+        return out
+    deltas = [prices[i] - prices[i - 1] for i in range(1, len(prices))]
+    avg_gain = sum(max(d, 0) for d in deltas[:period]) / period
+    avg_loss = sum(max(-d, 0) for d in deltas[:period]) / period
+
+    def value(gain, loss):
+        if loss == 0:
+            return 100.0 if gain > 0 else 50.0
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+    out[period] = value(avg_gain, avg_loss)
+    for i in range(period, len(deltas)):
+        avg_gain = (avg_gain * (period - 1) + max(deltas[i], 0)) / period
+        avg_loss = (avg_loss * (period - 1) + max(-deltas[i], 0)) / period
+        out[i + 1] = value(avg_gain, avg_loss)
+    return out
+
+
+def self_check(seed=0, length=700, coins=4):
+    """Porównuje wersje wektorowe i przyrostowe z referencyjnymi; rzuca AssertionError przy rozbieżności."""
+    rng = np.random.default_rng(seed)
+    matrix = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(coins, length)), axis=1))
+
+    for row in matrix:
+        np.testing.assert_allclose(rsi(row), _reference_rsi(list(row)), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(ema(row, 12), _reference_ema(list(row), 12), rtol=1e-9)
+    np.testing.assert_allclose(rsi(matrix)[1], rsi(matrix[1]), rtol=1e-12, equal_nan=True)
+
+    state = RsiState.from_prices(matrix[:, :300])
+    for column in matrix[:, 300:].T:
+        incremental = state.update(column)
+    np.testing.assert_allclose(incremental, rsi(matrix)[:, -1], rtol=1e-9)
+
+    ema_state = EmaState.from_values(matrix[0, :300], 12)
+    for value in matrix[0, 300:]:
+        ema_state.update(value)
+    np.testing.assert_allclose(ema_state.value, ema(matrix[0], 12)[-1], rtol=1e-9)
+    return True
+
+
+if __name__ == "__main__":
+    self_check()
+    print("Wskaźniki zgodne z implementacją referencyjną.")